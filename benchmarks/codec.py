@@ -0,0 +1,76 @@
+"""Compares the cache record codec in ``embedit.codec`` against the original
+``asdict`` + ``json.dumps`` encoding and ``match`` + ``**data`` decoding.
+
+Every record is first checked to round-trip through both, then each is timed over the
+same records and the average encoded size is reported.
+
+Run with ``python -m benchmarks.codec`` from the root of the repository.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import timeit
+from dataclasses import asdict
+
+from embedit import OpenGraphBaseData, OpenGraphImageData, OpenGraphTextData, OpenGraphVideoData
+from embedit.codec import decode_record, encode_record
+
+from .render import RECORDS
+
+
+def legacy_encode(data: OpenGraphBaseData) -> str:
+    return json.dumps(asdict(data))
+
+
+def legacy_decode(encoded: str, data_type: str) -> OpenGraphBaseData:
+    data = json.loads(encoded)
+    match data_type:
+        case "video":
+            return OpenGraphVideoData(**data)
+        case "text":
+            return OpenGraphTextData(**data)
+        case "image":
+            return OpenGraphImageData(**data)
+        case _:
+            raise Exception("Invalid data type.")  # noqa: TRY002, TRY003
+
+
+def check_round_trip() -> None:
+    for kind, records in RECORDS.items():
+        for data in records:
+            for encoded in (legacy_encode(data), encode_record(data)):
+                if decode_record(encoded, kind) != data:
+                    raise AssertionError(f"{kind} record doesn't round-trip:\n{data}\n{encoded}")  # noqa: TRY003
+
+
+def _per_op(func, args: argparse.Namespace, count: int) -> float:
+    best = min(timeit.repeat(func, number=args.number, repeat=args.repeat))
+    return best / (args.number * count) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--number", type=int, default=20_000, help="encodes/decodes per record per run.")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="runs per codec, the best is reported.")
+    args = parser.parse_args()
+
+    check_round_trip()
+    print("all records round-trip through both codecs.\n")
+    print(f"{'type':<8}{'codec':<8}{'encode (us)':>13}{'decode (us)':>13}{'encode/s':>12}{'decode/s':>12}{'bytes':>8}")
+
+    for kind, records in RECORDS.items():
+        for name, encode, decode in (("legacy", legacy_encode, legacy_decode), ("new", encode_record, decode_record)):
+            encoded = [encode(data) for data in records]
+            encode_us = _per_op(lambda: [encode(data) for data in records], args, len(records))  # noqa: B023
+            decode_us = _per_op(lambda: [decode(text, kind) for text in encoded], args, len(records))  # noqa: B023
+            size = sum(len(text.encode()) for text in encoded) / len(encoded)
+            print(
+                f"{kind:<8}{name:<8}{encode_us:>13.2f}{decode_us:>13.2f}"
+                f"{1e6 / encode_us:>12,.0f}{1e6 / decode_us:>12,.0f}{size:>8.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
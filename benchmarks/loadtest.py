@@ -0,0 +1,233 @@
+"""Load tests the embedit app against the local stand-in upstreams in ``benchmarks.upstreams``.
+
+The app is booted in this process with uvicorn, on a throwaway database, and configured
+to talk to the stand-ins. A seeded mix of TikTok videos, TikTok short links and tweets is
+then requested by bots (which get the embed) and humans (which get redirected), with
+``--hit-ratio`` of the requests going to a small set of hot posts and the rest to posts
+that were never requested before.
+
+Throughput, latency percentiles and memory are printed and saved as JSON, so a run can be
+compared against an earlier one with ``--compare``. The load is generated in the same process
+and event loop as the app, so absolute numbers are pessimistic; compare runs made on the
+same machine with the same arguments.
+
+Run with ``python -m benchmarks.loadtest`` from the root of the repository.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import aiohttp
+
+from .upstreams import Upstreams, short_code
+
+BOT_AGENT = "Mozilla/5.0 (compatible; Discordbot/2.0; +https://discordapp.com)"
+HUMAN_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
+RESULTS = Path(__file__).with_name("results")
+
+
+def write_config(directory: Path, upstreams: Upstreams) -> Path:
+    """Writes a config that points the app at the stand-ins and a fresh database."""
+    config = directory / "config.toml"
+    config.write_text(
+        f"""
+url = "http://127.0.0.1"
+repo = "https://github.com/imvaskel/embedit"
+color = "#FFFFFF"
+
+[sqlite]
+file = "{directory / "cache.db"}"
+
+[clients.tiktok]
+resolve = {{ "vm.tiktok.com" = "127.0.0.1:{upstreams.port}" }}
+
+[twitter]
+api_url = "{upstreams.url}"
+graphql_url = "{upstreams.url}/graphql"
+
+[tiktok]
+api_url = "{upstreams.url}/aweme/v1/feed/"
+"""
+    )
+    return config
+
+
+def workload(args: argparse.Namespace) -> list[tuple[str, bool]]:
+    """Builds the ``(path, is_bot)`` of every request, in order."""
+    rand = random.Random(args.seed)
+    next_id = 7_000_000_000_000_000_000
+
+    def post() -> str:
+        nonlocal next_id
+        next_id += 1
+        kind = rand.choices(("tiktok", "short", "twitter"), weights=(45, 10, 45))[0]
+        if kind == "tiktok":
+            return f"/tiktok.com/@user{next_id % 1000}/video/{next_id}"
+        if kind == "short":
+            # Plain http, so the pinned stand-in can answer it.
+            return f"/http://vm.tiktok.com/{short_code(next_id)}"
+        return f"/twitter.com/user{next_id % 1000}/status/{next_id % 10**18}"
+
+    hot = [post() for _ in range(args.hot_posts)]
+    return [
+        (rand.choice(hot) if rand.random() < args.hit_ratio else post(), rand.random() < args.bot_ratio)
+        for _ in range(args.requests)
+    ]
+
+
+def percentile(latencies: list[float], pct: int) -> float:
+    return statistics.quantiles(latencies, n=100, method="inclusive")[pct - 1] if len(latencies) > 1 else latencies[0]
+
+
+def rss_mib() -> float:
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return 0
+
+
+async def drive(base: str, requests: list[tuple[str, bool]], concurrency: int) -> tuple[list[float], Counter[int]]:
+    latencies: list[float] = []
+    statuses: Counter[int] = Counter()
+    queue = iter(requests)
+
+    async def worker(session: aiohttp.ClientSession) -> None:
+        for path, bot in queue:
+            start = time.perf_counter()
+            try:
+                async with session.get(
+                    base + path,
+                    headers={"User-Agent": BOT_AGENT if bot else HUMAN_AGENT},
+                    allow_redirects=False,
+                ) as res:
+                    await res.read()
+                    statuses[res.status] += 1
+            except aiohttp.ClientError:
+                statuses[0] += 1
+            latencies.append(time.perf_counter() - start)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    return latencies, statuses
+
+
+async def run(args: argparse.Namespace) -> dict:
+    import uvicorn
+
+    upstreams = Upstreams(latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+    await upstreams.start()
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["EMBEDIT_CONFIG"] = str(write_config(Path(directory), upstreams))
+        # The config is read on import, so the app can only be imported once it is written.
+        from embedit.__main__ import app
+
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        port = server.servers[0].sockets[0].getsockname()[1]
+
+        requests = workload(args)
+        rss_before = rss_mib()
+        start = time.perf_counter()
+        latencies, statuses = await drive(f"http://127.0.0.1:{port}", requests, args.concurrency)
+        elapsed = time.perf_counter() - start
+
+        server.should_exit = True
+        await serving
+    await upstreams.close()
+
+    return {
+        "label": args.label,
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "params": {
+            key: getattr(args, key)
+            for key in (
+                "requests",
+                "concurrency",
+                "hit_ratio",
+                "hot_posts",
+                "bot_ratio",
+                "latency",
+                "error_rate",
+                "seed",
+            )
+        },
+        "results": {
+            "requests_per_second": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": max(latencies) * 1000,
+            "rss_growth_mib": rss_mib() - rss_before,
+            "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "errors": sum(count for status, count in statuses.items() if status == 0 or status >= 400),
+        },
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "upstream_calls": dict(upstreams.calls),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()  # noqa: S607
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(result: dict, baseline: dict | None) -> None:
+    print(f"{result['label']} @ {result['commit']}: {result['params']}")
+    print(f"statuses: {result['statuses']}, upstream calls: {result['upstream_calls']}\n")
+    header = f"{'metric':<22}{'value':>12}"
+    if baseline:
+        header += f"{'baseline':>12}{'change':>10}"
+    print(header)
+    for key, value in result["results"].items():
+        line = f"{key:<22}{value:>12.2f}"
+        if baseline and (before := baseline["results"].get(key)):
+            line += f"{before:>12.2f}{(value - before) / before:>+10.1%}"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--requests", type=int, default=5000, help="requests to make.")
+    parser.add_argument("-c", "--concurrency", type=int, default=50, help="requests in flight at once.")
+    parser.add_argument("--hit-ratio", type=float, default=0.8, help="share of requests for hot posts.")
+    parser.add_argument("--hot-posts", type=int, default=200, help="how many hot posts there are.")
+    parser.add_argument("--bot-ratio", type=float, default=0.7, help="share of requests made by bots.")
+    parser.add_argument("--latency", type=float, default=0.05, help="average upstream latency, in seconds.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of upstream responses that fail.")
+    parser.add_argument("--seed", type=int, default=0, help="seeds the workload and the stand-ins.")
+    parser.add_argument("--label", default="loadtest", help="names the run in its results.")
+    parser.add_argument("-o", "--output", type=Path, help="where to save the results, by default results/<label>.json.")
+    parser.add_argument("--compare", type=Path, help="results of an earlier run to compare against.")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    report(result, baseline)
+
+    output = args.output or RESULTS / f"{args.label}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2) + "\n")
+    print(f"\nsaved results to {output}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Times each provider's parse path against recorded upstream responses, so the CPU cost
+of an embed can be tracked over time.
+
+The app runs with ``[fixtures] mode = "replay"`` (see ``embedit.fixtures``), so no request
+leaves the process and every run parses the exact same bytes. For each recorded post, this
+reports how long ``Provider.parse`` takes, and how long a whole embed takes: parsing, encoding
+the record for the cache and rendering the page. Wall time and CPU time are both reported;
+with nothing to wait on, they should be close.
+
+The fixtures in ``benchmarks/fixtures`` are recorded from the stand-ins in
+``benchmarks.upstreams`` with ``--record``. To record real responses instead, pass the posts
+with ``--record --url <url> ...``; replaying those needs the same urls again.
+
+Run with ``python -m benchmarks.providers`` from the root of the repository.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from .loadtest import RESULTS, git_commit
+from .upstreams import Upstreams, short_code
+
+FIXTURES = Path(__file__).with_name("fixtures")
+CASES = FIXTURES / "cases.json"
+# The stand-ins are recorded on a fixed port, as it is part of every fixture's url.
+STAND_IN_PORT = 18181
+
+
+def stand_in_cases() -> list[str]:
+    """Gets a post of every kind the stand-ins serve."""
+    video_id = 7_000_000_000_000_000_001
+    return [
+        f"https://tiktok.com/@user{video_id % 1000}/video/{video_id}",
+        f"http://vm.tiktok.com/{short_code(video_id + 1)}",
+        *(f"https://twitter.com/user{tweet_id % 1000}/status/{tweet_id}" for tweet_id in (3000, 3001, 3002)),
+    ]
+
+
+def stand_in_config() -> str:
+    """Gets the config that points the app at the stand-ins."""
+    url = f"http://127.0.0.1:{STAND_IN_PORT}"
+    return f"""
+[clients.tiktok]
+resolve = {{ "vm.tiktok.com" = "127.0.0.1:{STAND_IN_PORT}" }}
+
+[twitter]
+api_url = "{url}"
+graphql_url = "{url}/graphql"
+
+[tiktok]
+api_url = "{url}/aweme/v1/feed/"
+"""
+
+
+def write_config(directory: Path, mode: str, upstreams: str) -> Path:
+    config = directory / "config.toml"
+    config.write_text(
+        f"""
+url = "http://127.0.0.1"
+repo = "https://github.com/imvaskel/embedit"
+color = "#FFFFFF"
+
+[sqlite]
+file = "{directory / "cache.db"}"
+
+[fixtures]
+mode = "{mode}"
+directory = "{FIXTURES}"
+{upstreams}"""
+    )
+    return config
+
+
+async def boot() -> None:
+    """Starts the parts of the app that the providers need, without its database."""
+    from embedit import clients
+    from embedit.providers.tiktok.links import short_links
+    from embedit.providers.twitter.client import batcher, client
+
+    await clients.start()
+    await client.start()
+    # Every post is looked up on its own, so don't wait for others to batch it with.
+    batcher.window = 0
+    # Remember nothing, so every short link is resolved from its fixture.
+    short_links.max_entries = 0
+
+
+async def shutdown() -> None:
+    from embedit import clients
+    from embedit.providers.twitter.client import client
+
+    await client.close()
+    await clients.close()
+
+
+async def record(urls: list[str], upstreams: str) -> None:
+    from embedit import Deadline, find_provider
+
+    await boot()
+    for url in urls:
+        data = await find_provider(url).parse(url, Deadline.default())
+        print(f"recorded {url}: {data.to_type()}")
+    await shutdown()
+    CASES.write_text(json.dumps({"upstreams": upstreams, "urls": urls}, indent=2) + "\n")
+
+
+async def _time(func, number: int, repeat: int) -> tuple[float, float]:
+    """Gets the best wall and CPU time, in microseconds per call, of awaiting ``func`` ``number`` times."""
+    best_wall = best_cpu = float("inf")
+    for _ in range(repeat):
+        wall, cpu = time.perf_counter(), time.process_time()
+        for _ in range(number):
+            await func()
+        best_wall = min(best_wall, (time.perf_counter() - wall) / number * 1e6)
+        best_cpu = min(best_cpu, (time.process_time() - cpu) / number * 1e6)
+    return best_wall, best_cpu
+
+
+async def replay(urls: list[str], args: argparse.Namespace) -> dict[str, dict[str, float]]:
+    from embedit import CacheEntry, Deadline, find_provider
+
+    await boot()
+    results: dict[str, dict[str, float]] = {}
+    for url in urls:
+        provider = find_provider(url)
+
+        async def parse(provider=provider, url=url) -> None:
+            await provider.parse(url, Deadline.default())
+
+        async def embed(provider=provider, url=url) -> None:
+            CacheEntry.from_info(await provider.parse(url, Deadline.default()), expiry=0).render()
+
+        await embed()
+        parse_wall, parse_cpu = await _time(parse, args.number, args.repeat)
+        embed_wall, embed_cpu = await _time(embed, args.number, args.repeat)
+        results[url] = {
+            "provider": provider.name,
+            "parse_us": parse_wall,
+            "parse_cpu_us": parse_cpu,
+            "embed_us": embed_wall,
+            "embed_cpu_us": embed_cpu,
+        }
+    await shutdown()
+    return results
+
+
+def report(results: dict[str, dict], baseline: dict | None) -> None:
+    keys = ("parse_us", "parse_cpu_us", "embed_us", "embed_cpu_us")
+    print(f"{'provider':<10}{'post':<48}" + "".join(f"{key:>14}" for key in keys))
+    for url, result in results.items():
+        line = f"{result['provider']:<10}{url.split('://', 1)[1][:46]:<48}"
+        before = (baseline or {}).get(url)
+        for key in keys:
+            cell = f"{result[key]:.1f}"
+            if before and before.get(key):
+                cell += f" {(result[key] - before[key]) / before[key]:+.0%}"
+            line += f"{cell:>14}"
+        print(line)
+
+
+async def run(args: argparse.Namespace) -> dict[str, dict] | None:
+    upstreams: Upstreams | None = None
+    if args.record:
+        urls, config = args.url, ""
+        if not urls:
+            upstreams = Upstreams(latency=0)
+            await upstreams.start(port=STAND_IN_PORT)
+            urls, config = stand_in_cases(), stand_in_config()
+    else:
+        cases = json.loads(CASES.read_text())
+        urls, config = cases["urls"], cases["upstreams"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["EMBEDIT_CONFIG"] = str(write_config(Path(directory), "record" if args.record else "replay", config))
+        # The config is read on import, so the app can only be imported once it is written.
+        try:
+            if args.record:
+                await record(urls, config)
+                return None
+            return await replay(urls, args)
+        finally:
+            if upstreams is not None:
+                await upstreams.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--number", type=int, default=2000, help="parses per post per run.")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="runs per post, the best is reported.")
+    parser.add_argument("--record", action="store_true", help="record the fixtures instead of timing them.")
+    parser.add_argument("--url", action="append", default=[], help="with --record, a real post to record.")
+    parser.add_argument("--label", default="providers", help="names the run in its results.")
+    parser.add_argument("--compare", type=Path, help="results of an earlier run to compare against.")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if results is None:
+        print(f"\nsaved fixtures to {FIXTURES}.")
+        return
+
+    baseline = json.loads(args.compare.read_text())["results"] if args.compare else None
+    report(results, baseline)
+    output = RESULTS / f"{args.label}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({"label": args.label, "commit": git_commit(), "results": results}, indent=2) + "\n")
+    print(f"\nsaved results to {output}.")
+
+
+if __name__ == "__main__":
+    main()
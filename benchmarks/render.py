@@ -0,0 +1,112 @@
+"""Compares the precompiled templates in ``embedit.render`` against the original
+``to_meta`` + ``generate_html`` renderer.
+
+Every record is first checked to render byte-for-byte the same with both, then each
+renderer is timed over the same records.
+
+Run with ``python -m benchmarks.render`` from the root of the repository.
+"""
+
+from __future__ import annotations
+
+import argparse
+import timeit
+
+from embedit import OpenGraphBaseData, OpenGraphImageData, OpenGraphTextData, OpenGraphVideoData, generate_html
+
+RECORDS: dict[str, list[OpenGraphBaseData]] = {
+    "text": [
+        OpenGraphTextData(
+            title="Twitter",
+            description="just setting up my twttr &amp; <b>friends</b>",
+            author_name="jack (@jack)",
+            author_url="https://twitter.com/jack",
+            author_avatar="https://pbs.twimg.com/profile_images/1/avatar.jpg",
+            url="https://twitter.com/jack/status/20",
+            color="#1DA1F2",
+        ),
+        OpenGraphTextData(
+            title="Twitter",
+            description="",
+            author_name="no avatar (@none)",
+            author_url="https://twitter.com/none",
+            url="https://twitter.com/none/status/1",
+        ),
+    ],
+    "image": [
+        OpenGraphImageData(
+            title="Twitter",
+            description='a "photo" of a cat',
+            media_url="https://pbs.twimg.com/media/cat.jpg",
+            author_name="cats (@cats)",
+            author_url="https://twitter.com/cats",
+            width=1200,
+            height=0,
+            url="https://pbs.twimg.com/media/cat.jpg",
+            color="#1DA1F2",
+        ),
+    ],
+    "video": [
+        OpenGraphVideoData(
+            title="TikTok",
+            description="a dance",
+            media_url="https://v16m.tiktokcdn.com/video.mp4",
+            author_name="dancer [@dancer]",
+            thumbnail_url="https://p16-sign.tiktokcdn.com/cover.jpeg",
+            width=576,
+            height=1024,
+            author_url="https://tiktok.com/@dancer",
+            url="https://tiktok.com/@dancer/video/7351144126450059040",
+            color="#ff0050",
+        ),
+        OpenGraphVideoData(
+            title="Twitter",
+            description="a video with <html> & ümlauts",
+            media_url="https://video.twimg.com/ext_tw_video/1/pu/vid/720x1280/video.mp4",
+            author_name="video (@video)",
+            thumbnail_url="https://pbs.twimg.com/ext_tw_video_thumb/1/pu/img/thumb.jpg",
+            width=720,
+            height=1280,
+            author_url="https://twitter.com/video",
+            url="https://pbs.twimg.com/ext_tw_video_thumb/1/pu/img/thumb.jpg",
+        ),
+    ],
+}
+
+
+def legacy_render(data: OpenGraphBaseData) -> str:
+    return generate_html(head_children=data.to_meta(), body_children=None)
+
+
+def check_equivalence() -> None:
+    for kind, records in RECORDS.items():
+        for data in records:
+            expected = legacy_render(data)
+            actual = data.to_html()
+            if expected != actual:
+                raise AssertionError(f"{kind} record renders differently:\n{expected}\n{actual}")  # noqa: TRY003
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--number", type=int, default=20_000, help="renders per record per run.")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="runs per renderer, the best is reported.")
+    args = parser.parse_args()
+
+    check_equivalence()
+    print("all records render byte-for-byte the same.\n")
+    print(f"{'type':<8}{'legacy (us)':>14}{'template (us)':>16}{'speedup':>10}")
+
+    for kind, records in RECORDS.items():
+        results: list[float] = []
+        for render in (legacy_render, OpenGraphBaseData.to_html):
+            best = min(
+                timeit.repeat(lambda: [render(data) for data in records], number=args.number, repeat=args.repeat)  # noqa: B023
+            )
+            results.append(best / (args.number * len(records)) * 1e6)
+        legacy, template = results
+        print(f"{kind:<8}{legacy:>14.2f}{template:>16.2f}{legacy / template:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Local stand-ins for the upstreams embedit talks to, for benchmarking without touching
+the real ones.
+
+- TikTok's ``aweme/v1/feed`` api, at ``/aweme/v1/feed/``.
+- TikTok short links, at ``/<code>``, which redirect to the video ``<code>`` stands for.
+- Twitter's guest session activation and ``TweetResultsByRestIds`` graphql query, in the
+  response shape :meth:`TwitterProvider.parse` reads. Tweets are text, photos or videos
+  depending on their ID.
+
+Every response waits for a jittered ``latency`` first, and fails with a 503 ``error_rate`` of the time.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+from collections import Counter
+
+from aiohttp import web
+
+__all__ = ("Upstreams", "short_code", "tweet_result")
+
+
+def short_code(video_id: int) -> str:
+    """Gets the short link code that redirects to the given video."""
+    return f"ZS{video_id}"
+
+
+def _aweme(video_id: str) -> dict:
+    return {
+        "aweme_id": video_id,
+        "desc": f"video {video_id} #fyp",
+        "author": {"unique_id": f"user{int(video_id) % 1000}", "nickname": f"User {int(video_id) % 1000}"},
+        "video": {
+            "play_addr": {
+                "url_list": [f"https://v16m.tiktokcdn.com/{video_id}/video.mp4"],
+                "width": 576,
+                "height": 1024,
+            },
+            "cover": {"url_list": [f"https://p16-sign.tiktokcdn.com/{video_id}/cover.jpeg"]},
+        },
+    }
+
+
+def tweet_result(tweet_id: int) -> dict:
+    """Builds the ``tweetResult`` for a tweet. Tweets are text, photos or videos by their ID modulo 3."""
+    legacy: dict = {"full_text": f"tweet {tweet_id} & <friends>", "entities": {}}
+    match tweet_id % 3:
+        case 1:
+            legacy["entities"]["media"] = [
+                {
+                    "type": "photo",
+                    "media_url_https": f"https://pbs.twimg.com/media/{tweet_id}.jpg",
+                    "sizes": {"medium": {"w": 1200, "h": 675}},
+                }
+            ]
+        case 2:
+            legacy["entities"]["media"] = [
+                {
+                    "type": "video",
+                    "media_url_https": f"https://pbs.twimg.com/ext_tw_video_thumb/{tweet_id}/thumb.jpg",
+                    "video_info": {
+                        "variants": [
+                            {
+                                "content_type": "application/x-mpegURL",
+                                "url": f"https://video.twimg.com/{tweet_id}.m3u8",
+                            },
+                            {
+                                "content_type": "video/mp4",
+                                "url": f"https://video.twimg.com/ext_tw_video/{tweet_id}/pu/vid/720x1280/video.mp4",
+                            },
+                        ]
+                    },
+                }
+            ]
+    return {
+        "result": {
+            "rest_id": str(tweet_id),
+            "legacy": legacy,
+            "core": {
+                "user_results": {
+                    "result": {
+                        "legacy": {
+                            "name": f"User {tweet_id % 1000}",
+                            "screen_name": f"user{tweet_id % 1000}",
+                            "profile_image_url_https": f"https://pbs.twimg.com/profile_images/{tweet_id % 1000}.jpg",
+                        }
+                    }
+                }
+            },
+        }
+    }
+
+
+class Upstreams:
+    """Serves every stand-in from one local server.
+
+    Args:
+        latency (float): The average time, in seconds, each response waits before being sent.
+        error_rate (float): The share of responses, from 0 to 1, that fail with a 503.
+        seed (int | None): Seeds the latency jitter and errors, so runs can be repeated.
+    """
+
+    def __init__(self, *, latency: float = 0.05, error_rate: float = 0.0, seed: int | None = None) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls: Counter[str] = Counter()
+        """How many requests each stand-in got."""
+        self._random = random.Random(seed)
+        self._runner: web.AppRunner | None = None
+        self.port = 0
+
+        self.app = web.Application()
+        self.app.router.add_get("/aweme/v1/feed/", self._feed)
+        self.app.router.add_post("/1.1/guest/activate.json", self._activate)
+        self.app.router.add_get("/graphql/{query_id}/{name}", self._graphql)
+        self.app.router.add_get("/{code}", self._short_link)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self, port: int = 0) -> None:
+        """Starts serving on ``port``, or any free port if it is ``0``."""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _wait(self, name: str) -> None:
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * self._random.uniform(0.5, 1.5))
+        if self._random.random() < self.error_rate:
+            raise web.HTTPServiceUnavailable
+
+    async def _feed(self, request: web.Request) -> web.Response:
+        await self._wait("tiktok")
+        return web.json_response({"aweme_list": [_aweme(request.query["aweme_id"])]})
+
+    async def _activate(self, request: web.Request) -> web.Response:
+        self.calls["twitter_activate"] += 1
+        return web.json_response({"guest_token": str(self._random.getrandbits(60))})
+
+    async def _graphql(self, request: web.Request) -> web.Response:
+        await self._wait("twitter")
+        tweet_ids = json.loads(request.query["variables"])["tweetIds"]
+        return web.json_response({"data": {"tweetResult": [tweet_result(int(tweet_id)) for tweet_id in tweet_ids]}})
+
+    async def _short_link(self, request: web.Request) -> web.Response:
+        await self._wait("short_link")
+        video_id = request.match_info["code"].removeprefix("ZS")
+        raise web.HTTPMovedPermanently(f"https://www.tiktok.com/@user{int(video_id) % 1000}/video/{video_id}")
@@ -1,11 +1,52 @@
+from . import metrics as metrics
 from .agent import is_bot as is_bot
+from .batch import BatchResult as BatchResult
+from .batch import resolve_batch as resolve_batch
+from .batch import stream_batch as stream_batch
+from .cache import CacheEntry as CacheEntry
+from .cache import CacheResult as CacheResult
+from .cache import LookupResult as LookupResult
 from .cache import cache_data as cache_data
 from .cache import ensure_database as ensure_database
+from .cache import get_and_cache as get_and_cache
 from .cache import lifespan as lifespan
+from .cache import lookup as lookup
+from .cache import lookup_many as lookup_many
+from .cache import sweep_expired as sweep_expired
 from .cache import try_cache as try_cache
+from .cache import try_cache_many as try_cache_many
+from .cache import ttl_for as ttl_for
+from .clients import ClientStats as ClientStats
+from .clients import HTTPClients as HTTPClients
+from .clients import clients as clients
+from .codec import decode_record as decode_record
+from .codec import encode_record as encode_record
 from .config import CONFIG as CONFIG
 from .config import Config as Config
+from .db import Database as Database
+from .db import PoolStats as PoolStats
+from .db import database as database
+from .deadline import ClientDisconnected as ClientDisconnected
+from .deadline import Deadline as Deadline
+from .deadline import DeadlineExceeded as DeadlineExceeded
+from .deadline import cancel_on_disconnect as cancel_on_disconnect
+from .failures import Failure as Failure
+from .failures import FailureCache as FailureCache
+from .failures import failures as failures
+from .fixtures import FixtureStore as FixtureStore
+from .fixtures import MissingFixture as MissingFixture
+from .fixtures import fixtures as fixtures
 from .html import *  # noqa: F403
+from .http_cache import cache_control as cache_control
+from .http_cache import conditional as conditional
+from .http_cache import embed_headers as embed_headers
+from .http_cache import etag_for as etag_for
+from .http_cache import is_not_modified as is_not_modified
+from .http_cache import redirect_headers as redirect_headers
+from .lru import RenderCache as RenderCache
+from .lru import RenderedPage as RenderedPage
+from .lru import render_cache as render_cache
+from .metadata import RENDER_VERSION as RENDER_VERSION
 from .metadata import OpenGraphBaseData as OpenGraphBaseData
 from .metadata import OpenGraphImageData as OpenGraphImageData
 from .metadata import OpenGraphTextData as OpenGraphTextData
@@ -13,4 +54,12 @@ from .metadata import OpenGraphVideoData as OpenGraphVideoData
 from .models import Format as Format
 from .models import Thumbnail as Thumbnail
 from .models import YTDLOutput as YTDLOutput
+from .resilience import GuardStats as GuardStats
+from .resilience import UpstreamGuard as UpstreamGuard
+from .resilience import UpstreamUnavailable as UpstreamUnavailable
+from .resilience import guards as guards
+from .singleflight import SingleFlight as SingleFlight
 from .utils import find_provider as find_provider
+from .writer import CacheWriter as CacheWriter
+from .writer import WriterStats as WriterStats
+from .writer import cache_writer as cache_writer
@@ -1,38 +1,49 @@
 import base64
 import logging
+import time
 from typing import Annotated
 
-import asqlite
 import yt_dlp
 from fastapi import Depends, FastAPI, HTTPException, Request, Response
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from pydantic import BaseModel
 
 from embedit import (
     CONFIG,
-    cache_data,
-    ensure_database,
+    ClientStats,
+    Database,
+    Deadline,
+    GuardStats,
+    PoolStats,
+    RenderedPage,
+    WriterStats,
+    cache_control,
+    cache_writer,
+    cancel_on_disconnect,
+    clients,
+    conditional,
+    database,
+    embed_headers,
+    etag_for,
     find_provider,
-    generate_html,
+    guards,
     is_bot,
-    try_cache,
+    lifespan,
+    lookup,
+    metrics,
+    redirect_headers,
+    render_cache,
+    stream_batch,
+    ttl_for,
 )
-from embedit.providers import Provider
 
-pool: asqlite.Pool | None = None
 
+async def get_database(request: Request) -> Database:
+    return request.app.state.db
 
-async def database() -> asqlite.Pool:
-    global pool
-    if pool is None:
-        pool = await asqlite.create_pool(CONFIG["sqlite"]["file"])
-        async with pool.acquire() as conn:
-            logger.info("creating shared pool and ensuring it.")
-            await ensure_database(conn)
-    return pool
 
-
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 templates = Jinja2Templates(directory="templates")
 logger = logging.getLogger(__name__)
 
@@ -47,9 +58,50 @@ async def healthcheck() -> str:
     return "i am alive!"
 
 
+_breaker_states = {"closed": 0, "half_open": 1, "open": 2}
+
+
+@app.get("/metrics")
+async def get_metrics() -> Response:
+    # Gauges that mirror stats kept elsewhere are only updated when scraped.
+    lookups = {
+        result: metrics.cache_lookups.labels(result).value for result in ("memory", "hit", "stale", "negative", "miss")
+    }
+    if total := sum(lookups.values()):
+        metrics.cache_hit_ratio.set((total - lookups["miss"]) / total)
+    metrics.writer_queue.set(len(cache_writer))
+    for upstream, stats in clients.stats().items():
+        metrics.client_connections.labels(upstream, "in_use").set(stats.in_use)
+        metrics.client_connections.labels(upstream, "queued").set(stats.queued)
+    for provider, guard in guards.stats().items():
+        metrics.upstream_breaker_state.labels(provider).set(_breaker_states[guard.state])
+        metrics.upstream_limit.labels(provider).set(guard.limit)
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/healthcheck/clients")
+async def client_stats() -> dict[str, ClientStats]:
+    return clients.stats()
+
+
+@app.get("/healthcheck/database")
+async def database_stats() -> dict[str, PoolStats]:
+    return database.stats()
+
+
+@app.get("/healthcheck/upstreams")
+async def upstream_stats() -> dict[str, GuardStats]:
+    return guards.stats()
+
+
+@app.get("/healthcheck/writer")
+async def writer_stats() -> WriterStats:
+    return cache_writer.stats()
+
+
 @app.get("/ograph/")
-async def gen_ograph_json(author_name: str, title: str, url: str) -> dict[str, str]:
-    return {
+async def gen_ograph_json(request: Request, author_name: str, title: str, url: str) -> Response:
+    body = JSONResponse({
         "author_name": base64.b64decode(author_name).decode(),
         "author_url": url,
         "provider_name": "embedit",
@@ -57,7 +109,22 @@ async def gen_ograph_json(author_name: str, title: str, url: str) -> dict[str, s
         "title": f"Embedit - {title}",
         "type": "link",
         "version": "1.0",
-    }
+    }).body
+    # The response only depends on the query, so it can be cached for as long as we like.
+    headers = {"Cache-Control": cache_control(CONFIG["http_cache"]["oembed_max_age"]), "ETag": etag_for(body)}
+    return conditional(request, body, headers, media_type="application/json", endpoint="oembed")
+
+
+class BatchRequest(BaseModel):
+    urls: list[str]
+
+
+@app.post("/batch")
+async def batch(db: Annotated[Database, Depends(get_database)], body: BatchRequest) -> StreamingResponse:
+    """Resolves many urls at once, streaming back each one's OpenGraph data as a line of JSON as soon as it's ready."""
+    if len(body.urls) > (max_urls := CONFIG["batch"]["max_urls"]):
+        raise HTTPException(413, detail=f"a batch can have at most {max_urls} urls.")
+    return StreamingResponse(stream_batch(db, body.urls), media_type="application/x-ndjson")
 
 
 @app.exception_handler(yt_dlp.DownloadError)
@@ -67,21 +134,45 @@ async def handle_ytdlp_error(request: Request, exc: yt_dlp.DownloadError):
 
 
 @app.get("/{url:path}", response_class=HTMLResponse)
-async def get_url(pool: Annotated[asqlite.Pool, Depends(database)], request: Request, url: str):
-    async with pool.acquire() as conn:
-        url = request.url.path.lstrip("/")
-        info = await try_cache(conn, url)
-        if info:
-            logger.info("cache hit on endpoint %s, returning cache.", url)
+async def get_url(db: Annotated[Database, Depends(get_database)], request: Request, url: str):
+    url = request.url.path.lstrip("/")
+    bot = is_bot(request.headers.get("User-Agent"))
+
+    provider = find_provider(url)
+    if not provider:
+        raise HTTPException(404)
+    key = provider.canonicalize(url)
+
+    start = time.perf_counter()
+    source = "error"
+    metrics.requests_in_flight.inc()
+    try:
+        # A hit here means we can skip the pool, the database and rendering entirely.
+        if (page := render_cache.get(key)) is not None:
+            logger.debug("memory cache hit on endpoint %s.", key)
+            metrics.cache_lookups.labels("memory").inc()
+            source = "memory"
         else:
-            provider: Provider | None = find_provider(url)
-            if not provider:
-                raise HTTPException(404)
-
-            info = await provider.parse(url)
-
-            await cache_data(conn, info, url)
-
-    if is_bot(request.headers["User-Agent"]):
-        return generate_html(head_children=info.to_meta(), body_children=None)
-    return RedirectResponse(url)
+            deadline = Deadline.default()
+            # Nobody is left to answer once the client leaves or the budget runs out, so stop there.
+            async with deadline.stage("request"):
+                entry, source = await cancel_on_disconnect(request, lookup(db, provider, url, deadline=deadline))
+            # Entries don't keep when they were fetched, but they expire ``ttl`` after it.
+            modified = min(time.time(), entry.expiry - ttl_for(provider.name, entry.data_type))
+            page = RenderedPage.create(entry.render(), expiry=entry.expiry, modified=modified)
+            render_cache.put(key, page)
+    finally:
+        metrics.requests_in_flight.dec()
+        metrics.request_duration.labels(provider.name, source).observe(time.perf_counter() - start)
+
+    if bot:
+        return conditional(
+            request,
+            page.body,
+            embed_headers(page),
+            media_type="text/html",
+            endpoint="embed",
+            last_modified=page.modified,
+        )
+    # Urls are dispatched without a scheme too, but redirecting to one of those would be relative, back onto us.
+    return RedirectResponse(url if "://" in url else f"https://{url}", headers=redirect_headers())
@@ -1,4 +1,10 @@
 # Credit to https://github.com/Wikidepia/InstaFix/blob/main/utils/crawlerdetect.go for the list of crawlers used here.
+import re
+from functools import lru_cache
+
+from .config import CONFIG
+
+__all__ = ("is_bot", "known_bots")
 
 known_bots: list[str] = [
     "bot",
@@ -35,5 +41,23 @@ known_bots: list[str] = [
 ]
 
 
-def is_bot(ua: str) -> bool:
-    return any(bot in ua for bot in known_bots)
+known_bots += CONFIG["agent"]["extra_bots"]
+
+# A single case-insensitive alternation of every known bot, compiled once.
+_bot_regex = re.compile("|".join(re.escape(bot) for bot in known_bots), re.IGNORECASE)
+
+
+# A handful of crawler user agents make up nearly all of the traffic, so remember their verdicts.
+@lru_cache(maxsize=CONFIG["agent"]["verdict_cache_size"])
+def is_bot(ua: str | None) -> bool:
+    """Checks whether the given user agent belongs to a known crawler, ignoring case.
+
+    Args:
+        ua (str | None): The user agent, or ``None`` if the request didn't send one.
+
+    Returns:
+        bool: Whether the user agent is a bot.
+    """
+    if not ua:
+        return False
+    return _bot_regex.search(ua) is not None
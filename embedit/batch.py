@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import json
+import logging
+from collections.abc import AsyncIterator
+from dataclasses import asdict
+from typing import Any, NotRequired, TypedDict
+
+import yt_dlp
+from fastapi import HTTPException
+
+from .cache import CacheResult, lookup_many
+from .db import Database
+from .providers import Provider
+from .utils import find_provider
+
+__all__ = ("BatchResult", "resolve_batch", "stream_batch")
+
+logger = logging.getLogger(__name__)
+
+
+class BatchResult(TypedDict):
+    """The result for one url of a batch."""
+
+    index: int
+    url: str
+    status: int
+    source: NotRequired[CacheResult]
+    type: NotRequired[str]
+    data: NotRequired[dict[str, Any]]
+    detail: NotRequired[str]
+
+
+def _failed(index: int, url: str, exc: Exception) -> BatchResult:
+    # Failures get the same status they would on ``GET /{url}``.
+    if isinstance(exc, HTTPException):
+        return {"index": index, "url": url, "status": exc.status_code, "detail": exc.detail}
+    if isinstance(exc, yt_dlp.DownloadError):
+        logger.warning("encountered an error when downloading with yt_dlp: %s", exc)
+        return {"index": index, "url": url, "status": 400, "detail": "Bad Request"}
+    logger.error("failed to resolve %s in a batch.", url, exc_info=exc)
+    return {"index": index, "url": url, "status": 500, "detail": "Internal Server Error"}
+
+
+async def resolve_batch(db: Database, urls: list[str]) -> AsyncIterator[BatchResult]:
+    """Resolves the OpenGraph data of every url, yielding each one as soon as it is ready.
+
+    Urls that no provider handles come first, then cached ones, then the rest in the order
+    their fetches finish. See :func:`embedit.cache.lookup_many`.
+
+    Args:
+        db (Database): The database to look in.
+        urls (list[str]): The urls.
+
+    Yields:
+        BatchResult: The result of each url, with its ``index`` in ``urls``.
+    """
+    lookups: list[tuple[Provider, str]] = []
+    positions: list[int] = []
+    for index, url in enumerate(urls):
+        if (provider := find_provider(url)) is None:
+            yield {"index": index, "url": url, "status": 404, "detail": "Not Found"}
+            continue
+        lookups.append((provider, url))
+        positions.append(index)
+
+    async for result in lookup_many(db, lookups):
+        index = positions[result.index]
+        url = urls[index]
+        if result.error is not None or result.entry is None or result.source is None:
+            yield _failed(index, url, result.error or RuntimeError("lookup returned nothing."))
+            continue
+        info = result.entry.info
+        yield {
+            "index": index,
+            "url": url,
+            "status": 200,
+            "source": result.source,
+            "type": info.to_type(),
+            "data": asdict(info),
+        }
+
+
+async def stream_batch(db: Database, urls: list[str]) -> AsyncIterator[bytes]:
+    """Like :func:`resolve_batch`, but as newline delimited JSON."""
+    async for result in resolve_batch(db, urls):
+        yield json.dumps(result, ensure_ascii=False).encode() + b"\n"
@@ -1,22 +1,133 @@
-import datetime
-import json
-from contextlib import asynccontextmanager
-from dataclasses import asdict
+from __future__ import annotations
+
+import asyncio
+import logging
+import sqlite3
+import time
+from collections.abc import AsyncIterator, Sequence
+from contextlib import asynccontextmanager, nullcontext
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Literal, NamedTuple
 
 import asqlite
+import yt_dlp
 from fastapi import FastAPI, HTTPException
 
-from .metadata import OpenGraphBaseData, OpenGraphImageData, OpenGraphTextData, OpenGraphVideoData
-from .utils import find_provider
+from .clients import clients
+from .codec import decode_record, encode_record
+from .config import CONFIG
+from .db import Database, database
+from .deadline import Deadline, DeadlineExceeded
+from .failures import failures
+from .metadata import RENDER_VERSION, OpenGraphBaseData
+from .metrics import cache_lookups, inflight_fetches, upstream_duration, upstream_errors
+from .providers import PROVIDERS, Provider
+from .providers.extractor import extractor
+from .resilience import UpstreamUnavailable, guards
+from .singleflight import SingleFlight
+from .writer import UPSERT, cache_writer
+
+__all__ = (
+    "CacheEntry",
+    "CacheResult",
+    "LookupResult",
+    "cache_data",
+    "ensure_database",
+    "get_and_cache",
+    "lifespan",
+    "lookup",
+    "lookup_many",
+    "revalidate",
+    "sweep_expired",
+    "try_cache",
+    "try_cache_many",
+    "ttl_for",
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheEntry:
+    """A cached entry. The structured data is only decoded when :attr:`info` is accessed, so
+    serving the rendered page never pays for it.
+    """
+
+    data: str
+    data_type: str
+    expiry: float
+    html: bytes | None = None
+    """The rendered page, or ``None`` if it was rendered by an older version of the renderer."""
+
+    @classmethod
+    def from_info(cls, info: OpenGraphBaseData, *, expiry: float) -> CacheEntry:
+        entry = cls(data=encode_record(info), data_type=info.to_type(), expiry=expiry)
+        entry.__dict__["info"] = info
+        return entry
+
+    @cached_property
+    def info(self) -> OpenGraphBaseData:
+        return decode_record(self.data, self.data_type)
+
+    def render(self) -> bytes:
+        """Gets the rendered page, rendering it if it isn't already."""
+        if self.html is None:
+            self.html = self.info.to_html().encode()
+        return self.html
+
+    @property
+    def stale(self) -> bool:
+        """bool: Whether the entry has expired and is only being served while it is revalidated."""
+        return self.expiry <= time.time()
 
-__all__ = ("ensure_database", "lifespan", "cache_data")
+
+CacheResult = Literal["hit", "stale", "miss"]
+"""Where :func:`lookup` got an entry from."""
+
+_inflight: SingleFlight[CacheEntry] = SingleFlight()
+# Strong references to revalidation tasks, so they aren't garbage collected while running.
+_revalidating: set[asyncio.Task[CacheEntry]] = set()
+
+
+def ttl_for(provider: str, data_type: str) -> float:
+    """Gets how long, in seconds, data of the given type from the given provider should be cached for.
+
+    Args:
+        provider (str): The name of the provider, like ``TikTok``.
+        data_type (str): The type of the data, as given by :meth:`OpenGraphBaseData.to_type`.
+
+    Returns:
+        float: The ttl, falling back to the ``default`` ttls if the provider doesn't set one.
+    """
+    ttls = CONFIG["cache"]["ttl"]
+    return ttls.get(provider, {}).get(data_type, ttls["default"][data_type])
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    async with asqlite.connect("cache.db") as conn:
+    await database.open()
+    async with database.write() as conn:
+        logger.info("ensuring the database.")
         await ensure_database(conn)
-    yield
+    app.state.db = database
+    cache_writer.start(database)
+    failures.bind(database)
+
+    await clients.start()
+    for provider in PROVIDERS:
+        await provider.start(database)
+    sweeper = asyncio.create_task(_sweep_forever(database))
+    try:
+        yield
+    finally:
+        sweeper.cancel()
+        for provider in PROVIDERS:
+            await provider.close()
+        await clients.close()
+        extractor.shutdown()
+        await cache_writer.close()
+        await database.close()
 
 
 async def ensure_database(conn: asqlite.Connection):
@@ -24,49 +135,394 @@ async def ensure_database(conn: asqlite.Connection):
         sql = fp.read()
     async with conn.cursor() as cursor:
         await cursor.executescript(sql)
+        await _migrate(cursor)
         await conn.commit()
 
 
-async def cache_data(conn: asqlite.Connection, info: OpenGraphBaseData, url: str):
-    # Yes, i know this is cursed. But I'm lazy.
+# Columns added to ``cache`` after it was first created, which ``CREATE TABLE IF NOT EXISTS`` won't add.
+_added_columns: dict[str, str] = {
+    "html": "BLOB",
+    "render_version": "TEXT",
+}
+
+
+async def _migrate(cursor: asqlite.Cursor) -> None:
+    res = await cursor.execute("PRAGMA table_info(cache)")
+    existing = {row["name"] for row in await res.fetchall()}
+    for column, column_type in _added_columns.items():
+        if column not in existing:
+            logger.info("adding column %s to the cache table.", column)
+            await cursor.execute(f"ALTER TABLE cache ADD COLUMN {column} {column_type}")
+
+
+async def cache_data(
+    conn: asqlite.Connection, info: OpenGraphBaseData, url: str, *, ttl: float | None = None
+) -> CacheEntry:
+    """Caches the given data along with its rendered page, writing it straight away. Requests
+    queue their writes on :data:`embedit.writer.cache_writer` instead.
+
+    If ``ttl`` isn't given, the default ttl for the type of data is used.
+    """
+    if ttl is None:
+        ttl = ttl_for("default", info.to_type())
+    entry = CacheEntry.from_info(info, expiry=time.time() + ttl)
+
     async with conn.cursor() as cursor:
-        tomorrow = datetime.datetime.now() + datetime.timedelta(days=1)
         await cursor.execute(
-            "INSERT INTO cache(url, data, expiry, type) VALUES(?, ?, ?, ?)",
+            UPSERT,
             url,
-            json.dumps(asdict(info)),
-            tomorrow.timestamp(),
-            info.to_type(),
+            entry.data,
+            entry.expiry,
+            entry.data_type,
+            entry.render(),
+            RENDER_VERSION,
         )
+    return entry
+
+
+async def get_and_cache(db: Database, provider: Provider, url: str) -> CacheEntry:
+    """Gets the data for the url from the cache, or fetches and caches it on a miss. This is
+    :func:`lookup` without saying where the entry came from.
+    """
+    entry, _ = await lookup(db, provider, url)
+    return entry
+
+
+async def lookup(
+    db: Database, provider: Provider, url: str, *, deadline: Deadline | None = None
+) -> tuple[CacheEntry, CacheResult]:
+    """Gets the data for the url from the cache, or fetches and caches it on a miss.
+
+    Data is cached under :meth:`Provider.canonicalize`, so every variant of a url shares one entry.
+    Concurrent misses for the same entry share a single upstream fetch. Entries that expired
+    within the ``stale_while_revalidate`` window are returned as is while they are refreshed
+    in the background. Fetched entries are written in the background by the cache writer,
+    and are served from its queue until then. If fetching fails upstream, an entry that expired
+    within the ``stale_if_error`` window is served instead of the failure.
+
+    Args:
+        db (Database): The database to look in.
+        provider (Provider): The provider the url belongs to.
+        url (str): The url.
+        deadline (Deadline | None): The time budget for fetching the url on a miss. If it joins a
+            fetch that is already running, that fetch keeps the budget it was started with.
+            Defaults to :meth:`Deadline.default`.
+
+    Returns:
+        tuple[CacheEntry, CacheResult]: The entry, and whether it was a ``hit``, a ``stale`` hit or a ``miss``.
+    """
+    key = provider.canonicalize(url)
+    entry = cache_writer.get(key)
+    if entry is None:
+        async with db.read() as conn:
+            entry = await try_cache(conn, key, stale_for=CONFIG["cache"]["stale_while_revalidate"])
+    if found := _serve_cached(provider, url, key, entry):
+        return found
+
+    try:
+        await _raise_if_failed(key)
+        cache_lookups.labels("miss").inc()
+        return await _inflight.do(key, lambda: _fetch_and_cache(provider, url, key, deadline)), "miss"
+    except Exception as exc:
+        if (stale := await _stale_if_error(db, key, exc)) is None:
+            raise
+        return stale, "stale"
+
+
+class LookupResult(NamedTuple):
+    """The result of one lookup in :func:`lookup_many`."""
+
+    index: int
+    """The position of the lookup in the ones given."""
+    entry: CacheEntry | None
+    source: CacheResult | None
+    error: Exception | None
+    """Why fetching the entry failed, in which case there is no ``entry`` or ``source``."""
+
+
+async def lookup_many(db: Database, lookups: Sequence[tuple[Provider, str]]) -> AsyncIterator[LookupResult]:
+    """Like :func:`lookup`, but for many urls at once, yielding each result as soon as it is ready.
+
+    Every url that isn't queued in the cache writer is looked up in a single query, and cached
+    entries are yielded straight away. Misses are then fetched concurrently, but at most
+    ``[batch] concurrency`` at a time for each provider, and yielded in the order they finish.
+    Lookups for the same entry share one fetch. A failed fetch is yielded with its ``error``
+    instead of being raised, so it doesn't fail the others.
 
+    If the caller stops iterating, fetches that haven't started yet are cancelled.
 
-async def get_and_cache(conn: asqlite.Connection, url: str) -> OpenGraphBaseData:
-    info = await try_cache(conn, url)
-    if info:
-        return info
+    Args:
+        db (Database): The database to look in.
+        lookups (Sequence[tuple[Provider, str]]): Each url, along with the provider it belongs to.
 
-    provider = find_provider(url)
-    if not provider:
-        raise HTTPException(404)
+    Yields:
+        LookupResult: The result of each lookup.
+    """
+    by_key: dict[str, list[int]] = {}
+    for index, (provider, url) in enumerate(lookups):
+        by_key.setdefault(provider.canonicalize(url), []).append(index)
 
-    return await provider.parse(url)
+    entries = {key: entry for key in by_key if (entry := cache_writer.get(key)) is not None}
+    if unqueued := [key for key in by_key if key not in entries]:
+        async with db.read() as conn:
+            entries |= await try_cache_many(conn, unqueued, stale_for=CONFIG["cache"]["stale_while_revalidate"])
 
+    misses: list[str] = []
+    for key, indices in by_key.items():
+        provider, url = lookups[indices[0]]
+        if found := _serve_cached(provider, url, key, entries.get(key)):
+            for index in indices:
+                yield LookupResult(index, *found, None)
+        else:
+            misses.append(key)
+    if misses:
+        async for result in _fetch_many(db, lookups, by_key, misses):
+            yield result
 
-async def try_cache(conn: asqlite.Connection, url: str) -> OpenGraphBaseData | None:
+
+async def _fetch_many(
+    db: Database, lookups: Sequence[tuple[Provider, str]], by_key: dict[str, list[int]], misses: list[str]
+) -> AsyncIterator[LookupResult]:
+    limits = CONFIG["batch"]["concurrency"]
+    semaphores: dict[str, asyncio.Semaphore] = {}
+
+    async def fetch(key: str) -> tuple[str, CacheEntry | None, CacheResult | None, Exception | None]:
+        provider, url = lookups[by_key[key][0]]
+        semaphore = semaphores.get(provider.name)
+        if semaphore is None:
+            semaphore = semaphores[provider.name] = asyncio.Semaphore(limits.get(provider.name, limits["default"]))
+        try:
+            await _raise_if_failed(key)
+            cache_lookups.labels("miss").inc()
+            async with semaphore:
+                entry = await _inflight.do(key, lambda: _fetch_and_cache(provider, url, key))
+        except Exception as exc:
+            if (stale := await _stale_if_error(db, key, exc)) is not None:
+                return key, stale, "stale", None
+            return key, None, None, exc
+        return key, entry, "miss", None
+
+    tasks = [asyncio.create_task(fetch(key)) for key in misses]
+    try:
+        for task in asyncio.as_completed(tasks):
+            key, entry, source, error = await task
+            for index in by_key[key]:
+                yield LookupResult(index, entry, source, error)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _serve_cached(
+    provider: Provider, url: str, key: str, entry: CacheEntry | None
+) -> tuple[CacheEntry, CacheResult] | None:
+    # Decides whether a cached entry can be served, revalidating it if it is stale.
+    if entry and entry.html is None:
+        # The renderer changed since this was cached, so lazily rerender it.
+        try:
+            entry.render()
+        except ValueError:
+            # The data was cached with a record layout that no longer exists, so refetch it.
+            entry = None
+        else:
+            cache_writer.submit(key, entry)
+    if entry and entry.stale:
+        logger.info("stale cache hit on endpoint %s, revalidating.", key)
+        revalidate(provider, url)
+        cache_lookups.labels("stale").inc()
+        return entry, "stale"
+    if entry:
+        logger.info("cache hit on endpoint %s, returning cache.", key)
+        cache_lookups.labels("hit").inc()
+        return entry, "hit"
+    return None
+
+
+async def _stale_if_error(db: Database, key: str, exc: Exception) -> CacheEntry | None:
+    # Gets an expired entry to serve instead of an upstream failure, if there is one.
+    if isinstance(exc, HTTPException) and exc.status_code < 500:
+        return None
+    async with db.read() as conn:
+        entry = await try_cache(conn, key, stale_for=CONFIG["cache"]["stale_if_error"])
+    if entry is None:
+        return None
+    try:
+        entry.render()
+    except ValueError:
+        return None
+    logger.info("serving stale cache for %s, as fetching it failed: %s", key, exc)
+    cache_lookups.labels("stale").inc()
+    return entry
+
+
+async def _raise_if_failed(key: str) -> None:
+    # Answers lookups that recently failed upstream with the same failure.
+    if (failure := await failures.get(key)) is not None:
+        logger.info("negative cache hit on endpoint %s.", key)
+        cache_lookups.labels("negative").inc()
+        raise failure.exception()
+
+
+def revalidate(provider: Provider, url: str) -> None:
+    """Refetches and recaches the url in the background, unless it is already being fetched,
+    recently failed to be or its provider's circuit breaker is open.
+    """
+    key = provider.canonicalize(url)
+    if key in _inflight or failures.peek(key) or not guards.get(provider.name).available:
+        return
+
+    task = asyncio.create_task(_inflight.do(key, lambda: _fetch_and_cache(provider, url, key)))
+    _revalidating.add(task)
+    task.add_done_callback(_revalidated)
+
+
+def _revalidated(task: asyncio.Task[CacheEntry]) -> None:
+    _revalidating.discard(task)
+    if not task.cancelled() and (exc := task.exception()):
+        logger.warning("failed to revalidate cache entry: %s", exc)
+
+
+async def _fetch_and_cache(provider: Provider, url: str, key: str, deadline: Deadline | None = None) -> CacheEntry:
+    # This fails straight away, without being remembered, if the provider's upstream is unhealthy.
+    async with guards.get(provider.name).call() if provider.guarded else nullcontext():
+        start = time.perf_counter()
+        inflight_fetches.inc()
+        try:
+            info = await provider.parse(url, deadline or Deadline.default())
+        except UpstreamUnavailable:
+            # The provider's own guard turned it away, like Twitter's does for batches.
+            raise
+        except DeadlineExceeded as exc:
+            upstream_errors.labels(provider.name, str(exc.status_code)).inc()
+            # This request ran out of time, which doesn't mean the next one will.
+            raise
+        except HTTPException as exc:
+            upstream_errors.labels(provider.name, str(exc.status_code)).inc()
+            failures.record(key, exc.status_code, exc.detail if isinstance(exc.detail, str) else None)
+            raise
+        except yt_dlp.DownloadError:
+            upstream_errors.labels(provider.name, "download_error").inc()
+            # The same status ``handle_ytdlp_error`` answers with.
+            failures.record(key, 400)
+            raise
+        except Exception:
+            upstream_errors.labels(provider.name, "exception").inc()
+            failures.record(key, 500)
+            raise
+        finally:
+            inflight_fetches.dec()
+            upstream_duration.labels(provider.name).observe(time.perf_counter() - start)
+    entry = CacheEntry.from_info(info, expiry=time.time() + ttl_for(provider.name, info.to_type()))
+    cache_writer.submit(key, entry)
+    return entry
+
+
+async def try_cache(conn: asqlite.Connection, url: str, *, stale_for: float = 0) -> CacheEntry | None:
+    """Gets the cached data for the url.
+
+    Args:
+        conn (asqlite.Connection): The connection to use.
+        url (str): The url.
+        stale_for (float): How long, in seconds, past its expiry an entry is still returned for.
+            Check :attr:`CacheEntry.stale` to tell these apart.
+
+    Returns:
+        CacheEntry | None: The cached entry, if there is one.
+    """
     async with conn.cursor() as cursor:
-        res = await cursor.execute("SELECT * FROM cache WHERE url = ?", url)
+        res = await cursor.execute("SELECT * FROM cache WHERE url = ? AND expiry > ?", url, time.time() - stale_for)
         row = await res.fetchone()
         if not row:
             return None
 
-        data_type: str = row["type"]
-        data = json.loads(row["data"])
-        match data_type:
-            case "video":
-                return OpenGraphVideoData(**data)
-            case "text":
-                return OpenGraphTextData(**data)
-            case "image":
-                return OpenGraphImageData(**data)
-            case _:
-                raise Exception("Invalid data type.")  # noqa: TRY002, TRY003
+        return _entry(row)
+
+
+async def try_cache_many(
+    conn: asqlite.Connection, urls: Sequence[str], *, stale_for: float = 0
+) -> dict[str, CacheEntry]:
+    """Gets the cached data for several urls, in as few queries as possible.
+
+    Args:
+        conn (asqlite.Connection): The connection to use.
+        urls (Sequence[str]): The urls.
+        stale_for (float): Like in :func:`try_cache`.
+
+    Returns:
+        dict[str, CacheEntry]: The cached entry of each url that has one.
+    """
+    entries: dict[str, CacheEntry] = {}
+    cutoff = time.time() - stale_for
+    async with conn.cursor() as cursor:
+        # Older versions of sqlite only allow 999 parameters in a statement.
+        for start in range(0, len(urls), _max_params):
+            chunk = urls[start : start + _max_params]
+            placeholders = ",".join("?" * len(chunk))
+            res = await cursor.execute(
+                f"SELECT * FROM cache WHERE url IN ({placeholders}) AND expiry > ?",  # noqa: S608
+                *chunk,
+                cutoff,
+            )
+            for row in await res.fetchall():
+                entries[row["url"]] = _entry(row)
+    return entries
+
+
+_max_params = 900
+
+
+def _entry(row: sqlite3.Row) -> CacheEntry:
+    return CacheEntry(
+        data=row["data"],
+        data_type=row["type"],
+        expiry=row["expiry"],
+        html=row["html"] if row["render_version"] == RENDER_VERSION else None,
+    )
+
+
+async def sweep_expired(db: Database, *, batch_size: int, grace: float = 0) -> int:
+    """Deletes every expired row from the cache in batches of ``batch_size``.
+
+    The write connection is only held for one batch at a time, so queued cache writes get to go
+    in between batches instead of waiting for the whole sweep.
+
+    Args:
+        db (Database): The database to sweep.
+        batch_size (int): The maximum amount of rows deleted per statement.
+        grace (float): How long, in seconds, past their expiry rows are kept for.
+
+    Returns:
+        int: The amount of rows removed.
+    """
+    removed = 0
+    now = time.time() - grace
+    while True:
+        async with db.write() as conn, conn.cursor() as cursor:
+            await cursor.execute(
+                "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache WHERE expiry <= ? LIMIT ?)",
+                now,
+                batch_size,
+            )
+            deleted = cursor.get_cursor().rowcount
+        removed += deleted
+        if deleted < batch_size:
+            return removed
+        # Let anything waiting on the write connection have it between batches.
+        await asyncio.sleep(0)
+
+
+async def _sweep_forever(db: Database) -> None:
+    interval = CONFIG["cache"]["sweep_interval"]
+    batch_size = CONFIG["cache"]["sweep_batch_size"]
+    # Expired entries are kept for as long as they might still be served.
+    grace = max(CONFIG["cache"]["stale_while_revalidate"], CONFIG["cache"]["stale_if_error"])
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            removed = await sweep_expired(db, batch_size=batch_size, grace=grace)
+            async with db.write() as conn:
+                removed_failures = await failures.sweep(conn)
+        except Exception:
+            logger.exception("failed to sweep expired cache entries.")
+        else:
+            logger.info("swept %d expired cache entries and %d expired failures.", removed, removed_failures)
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import logging
+import socket
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any
+
+import aiohttp
+from aiohttp.abc import AbstractResolver, ResolveResult
+
+from .config import CONFIG, ClientConfig
+from .fixtures import FixtureSession, fixtures
+from .metrics import client_reused
+
+__all__ = ("ClientStats", "HTTPClients", "client_config", "clients")
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ClientStats:
+    """Connection pool statistics for one upstream."""
+
+    requests: int = 0
+    """How many requests have been started."""
+    in_use: int = 0
+    """How many connections are currently checked out of the pool."""
+    queued: int = 0
+    """How many requests are currently waiting for a connection, because the pool is at its limit."""
+    created: int = 0
+    """How many new connections have been opened."""
+    reused: int = 0
+    """How many requests reused a kept alive connection."""
+
+
+def client_config(name: str) -> ClientConfig:
+    """Gets the config for the named client, falling back to the ``default`` client for anything it doesn't set.
+
+    Args:
+        name (str): The name of the client, like ``tiktok``.
+
+    Returns:
+        ClientConfig: The config.
+    """
+    configs = CONFIG["clients"]
+    return configs["default"] | configs.get(name, {})  # type: ignore - both halves are ClientConfigs.
+
+
+class _PinnedResolver(AbstractResolver):
+    """Connects pinned hostnames to a fixed ``host:port``, and resolves everything else normally."""
+
+    def __init__(self, pins: dict[str, str]) -> None:
+        self._pins: dict[str, tuple[str, int]] = {}
+        for host, address in pins.items():
+            pinned_host, _, port = address.rpartition(":")
+            self._pins[host] = (pinned_host, int(port))
+        self._default = aiohttp.DefaultResolver()
+
+    async def resolve(
+        self, host: str, port: int = 0, family: socket.AddressFamily = socket.AF_INET
+    ) -> list[ResolveResult]:
+        if (pin := self._pins.get(host)) is None:
+            return await self._default.resolve(host, port, family)
+        pinned_host, pinned_port = pin
+        return [
+            {
+                "hostname": host,
+                "host": pinned_host,
+                "port": pinned_port,
+                "family": socket.AF_INET,
+                "proto": 0,
+                "flags": socket.AI_NUMERICHOST,
+            }
+        ]
+
+    async def close(self) -> None:
+        await self._default.close()
+
+
+class HTTPClients:
+    """The ``aiohttp`` sessions used to talk to each upstream, owned by the app's lifespan.
+
+    Providers :meth:`register` the upstreams they talk to when they are imported, and :meth:`get`
+    the session by name when making requests. Each upstream gets its own connection pool, with
+    the limits, keep-alive, DNS caching and timeouts from its ``[clients.<name>]`` config.
+    """
+
+    def __init__(self) -> None:
+        self._headers: dict[str, dict[str, str]] = {}
+        self._fixture_params: dict[str, tuple[str, ...] | None] = {}
+        self._sessions: dict[str, aiohttp.ClientSession] = {}
+        self._fixtures: dict[str, FixtureSession] = {}
+        self._stats: dict[str, ClientStats] = {}
+
+    def register(
+        self,
+        name: str,
+        *,
+        headers: dict[str, str] | None = None,
+        fixture_params: tuple[str, ...] | None = None,
+    ) -> None:
+        """Registers an upstream, so that its session is created when the app starts.
+
+        Args:
+            name (str): The name of the upstream, which is also the name of its config section.
+            headers (dict[str, str] | None): Headers sent with every request to this upstream.
+            fixture_params (tuple[str, ...] | None): The query parameters that identify a request
+                when recording or replaying fixtures, or ``None`` if all of them do.
+        """
+        self._headers[name] = headers or {}
+        self._fixture_params[name] = fixture_params
+        self._stats.setdefault(name, ClientStats())
+
+    def get(self, name: str) -> aiohttp.ClientSession:
+        """Gets the session for the named upstream.
+
+        When fixtures are being recorded or replayed, this is a :class:`FixtureSession` standing in for it.
+
+        Raises:
+            RuntimeError: If the clients haven't been started, or the upstream was never registered.
+        """
+        try:
+            session = self._sessions[name]
+        except KeyError:
+            raise RuntimeError(f"the {name} http client hasn't been started.") from None  # noqa: TRY003
+        if fixtures.mode == "off":
+            return session
+        if (wrapped := self._fixtures.get(name)) is None:
+            wrapped = self._fixtures[name] = fixtures.session(name, session, params=self._fixture_params[name])
+        return wrapped  # type: ignore - it stands in for the parts of a session that providers use.
+
+    async def start(self) -> None:
+        for name, headers in self._headers.items():
+            if name in self._sessions:
+                continue
+            config = client_config(name)
+            connector = aiohttp.TCPConnector(
+                limit=config["limit"],
+                limit_per_host=config["limit_per_host"],
+                keepalive_timeout=config["keepalive_timeout"],
+                ttl_dns_cache=config["ttl_dns_cache"],
+                resolver=_PinnedResolver(config["resolve"]) if config["resolve"] else None,
+            )
+            self._sessions[name] = aiohttp.ClientSession(
+                connector=connector,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=config["timeout"], connect=config["connect_timeout"]),
+                trace_configs=[self._trace(name, self._stats[name])],
+            )
+            logger.info("started the %s http client.", name)
+
+    async def close(self) -> None:
+        sessions, self._sessions = self._sessions, {}
+        self._fixtures.clear()
+        for session in sessions.values():
+            await session.close()
+
+    def stats(self) -> dict[str, ClientStats]:
+        """Gets the connection pool statistics of every upstream, by name."""
+        for name, session in self._sessions.items():
+            # aiohttp doesn't trace connections being released, so ask the pool directly.
+            self._stats[name].in_use = len(getattr(session.connector, "_acquired", ()))
+        return dict(self._stats)
+
+    @staticmethod
+    def _trace(name: str, stats: ClientStats) -> aiohttp.TraceConfig:
+        async def on_request_start(session: Any, ctx: SimpleNamespace, params: Any) -> None:
+            stats.requests += 1
+
+        async def on_queued_start(session: Any, ctx: SimpleNamespace, params: Any) -> None:
+            stats.queued += 1
+
+        async def on_queued_end(session: Any, ctx: SimpleNamespace, params: Any) -> None:
+            stats.queued -= 1
+
+        async def on_create_end(session: Any, ctx: SimpleNamespace, params: Any) -> None:
+            stats.created += 1
+
+        async def on_reuse(session: Any, ctx: SimpleNamespace, params: Any) -> None:
+            stats.reused += 1
+            client_reused.labels(name).inc()
+
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_queued_start.append(on_queued_start)
+        trace.on_connection_queued_end.append(on_queued_end)
+        trace.on_connection_create_end.append(on_create_end)
+        trace.on_connection_reuseconn.append(on_reuse)
+        return trace
+
+
+clients = HTTPClients()
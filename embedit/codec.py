@@ -0,0 +1,91 @@
+"""Encodes :class:`OpenGraphBaseData` records for the cache.
+
+A record is stored as a compact JSON array of its fields, in the order the class declares them,
+led by a tag naming its type and layout::
+
+    ["v07f2", "TikTok", "a dance", "#ff0050", ...]
+
+Leaving out the keys makes entries much smaller than a JSON object, and decoding sets each
+slot directly instead of building a dict to pass to the constructor. The tag's suffix is a
+hash of the field names, so a row written before a field was added, removed or reordered
+is rejected instead of being decoded into the wrong fields.
+
+Rows cached before this format are JSON objects, which are still read.
+"""
+
+from __future__ import annotations
+
+import json
+import zlib
+from dataclasses import fields
+from operator import attrgetter
+from typing import Any
+
+from .metadata import OpenGraphBaseData, OpenGraphImageData, OpenGraphTextData, OpenGraphVideoData
+
+__all__ = ("decode_record", "encode_record")
+
+
+class _Layout:
+    __slots__ = ("cls", "getter", "names", "setters", "tag")
+
+    def __init__(self, cls: type[OpenGraphBaseData], prefix: str) -> None:
+        self.cls = cls
+        self.names = tuple(field.name for field in fields(cls))
+        self.tag = f"{prefix}{zlib.crc32(','.join(self.names).encode()) & 0xFFFF:04x}"
+        self.getter = attrgetter(*self.names)
+        # The slot descriptors, so decoding can skip ``__init__`` and set each field directly.
+        self.setters = tuple(getattr(cls, name).__set__ for name in self.names)
+
+
+_layouts = {
+    "text": _Layout(OpenGraphTextData, "t"),
+    "image": _Layout(OpenGraphImageData, "i"),
+    "video": _Layout(OpenGraphVideoData, "v"),
+}
+_by_tag = {layout.tag: layout for layout in _layouts.values()}
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), check_circular=False)
+_decode = json.JSONDecoder().decode
+
+
+def encode_record(data: OpenGraphBaseData) -> str:
+    """Encodes the record.
+
+    Args:
+        data (OpenGraphBaseData): The record.
+
+    Returns:
+        str: The encoded record.
+    """
+    layout = _layouts[data.to_type()]
+    return _encoder.encode([layout.tag, *layout.getter(data)])
+
+
+def decode_record(encoded: str, data_type: str) -> OpenGraphBaseData:
+    """Decodes a record made by :func:`encode_record`, or a JSON object from before it existed.
+
+    Args:
+        encoded (str): The encoded record.
+        data_type (str): The type of the record, as given by :meth:`OpenGraphBaseData.to_type`.
+            This is only needed for old records, new ones carry their own type.
+
+    Raises:
+        ValueError: If the record was encoded with a layout that no longer exists, or is of an unknown type.
+
+    Returns:
+        OpenGraphBaseData: The record.
+    """
+    values: Any = _decode(encoded)
+    if isinstance(values, dict):
+        if data_type not in _layouts:
+            raise ValueError(f"unknown record type {data_type!r}.")  # noqa: TRY003
+        return _layouts[data_type].cls(**values)
+
+    layout = _by_tag.get(values[0])
+    if layout is None or len(values) != len(layout.names) + 1:
+        raise ValueError(f"record was encoded with an unknown layout {values[0]!r}.")  # noqa: TRY003
+
+    data = layout.cls.__new__(layout.cls)
+    for setter, value in zip(layout.setters, values[1:], strict=False):
+        setter(data, value)
+    return data
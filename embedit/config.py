@@ -1,11 +1,108 @@
 from __future__ import annotations
 
+import os
 import tomllib
-from typing import TypedDict
+from typing import Any, Literal, TypedDict
 
 
 class SqliteConfig(TypedDict):
     file: str
+    read_pool_size: int
+
+
+class MemoryCacheConfig(TypedDict):
+    max_entries: int
+    max_bytes: int
+
+
+class CacheConfig(TypedDict):
+    sweep_interval: float
+    sweep_batch_size: int
+    stale_while_revalidate: float
+    stale_if_error: float
+    write_queue_size: int
+    write_batch_size: int
+    # Provider name (or ``default``) to data type to ttl in seconds.
+    ttl: dict[str, dict[str, float]]
+
+
+class HTTPCacheConfig(TypedDict):
+    redirect_max_age: float
+    oembed_max_age: float
+
+
+class NegativeCacheConfig(TypedDict):
+    max_entries: int
+    # Status code, or a class like ``5xx``, to how long in seconds a failure with it is cached for.
+    ttl: dict[str, float]
+
+
+class AgentConfig(TypedDict):
+    extra_bots: list[str]
+    verdict_cache_size: int
+
+
+class ExtractorConfig(TypedDict):
+    mode: Literal["thread", "process"]
+    workers: int
+    timeout: float
+
+
+class ClientConfig(TypedDict):
+    limit: int
+    limit_per_host: int
+    keepalive_timeout: float
+    ttl_dns_cache: int
+    timeout: float
+    connect_timeout: float
+    # Hostname to the ``host:port`` it should connect to instead, like curl's ``--resolve``.
+    resolve: dict[str, str]
+
+
+class ResilienceConfig(TypedDict):
+    failure_threshold: int
+    reset_timeout: float
+    initial_limit: int
+    min_limit: int
+    max_limit: int
+    backoff: float
+    queue_timeout: float
+
+
+class TwitterConfig(TypedDict):
+    api_url: str
+    graphql_url: str
+    sessions: int
+    session_lifetime: float
+    session_wait: float
+    batch_window: float
+    batch_size: int
+
+
+class TikTokConfig(TypedDict):
+    api_url: str
+    app_install_ids: list[str]
+    hedge_percentile: float
+    hedge_min_delay: float
+    hedge_initial_delay: float
+    short_link_cache_size: int
+
+
+class DeadlineConfig(TypedDict):
+    request: float
+    # Stage name to the most time, in seconds, it may take out of a request's budget.
+    stages: dict[str, float]
+
+
+class BatchConfig(TypedDict):
+    max_urls: int
+    # Provider name (or ``default``) to how many of its misses one batch fetches at once.
+    concurrency: dict[str, int]
+
+
+class FixturesConfig(TypedDict):
+    mode: Literal["off", "record", "replay"]
+    directory: str
 
 
 class Config(TypedDict):
@@ -13,12 +110,149 @@ class Config(TypedDict):
     repo: str
     color: str
     sqlite: SqliteConfig
+    agent: AgentConfig
+    cache: CacheConfig
+    memory_cache: MemoryCacheConfig
+    http_cache: HTTPCacheConfig
+    negative_cache: NegativeCacheConfig
+    extractor: ExtractorConfig
+    # Upstream name (or ``default``) to its http client's config.
+    clients: dict[str, ClientConfig]
+    # Provider name (or ``default``) to its upstream's circuit breaker and concurrency limit.
+    resilience: dict[str, ResilienceConfig]
+    twitter: TwitterConfig
+    tiktok: TikTokConfig
+    deadline: DeadlineConfig
+    batch: BatchConfig
+    fixtures: FixturesConfig
+
+
+# Sections that older config files may not have. Anything set in ``config.toml`` wins.
+_DEFAULTS: dict[str, Any] = {
+    "sqlite": {
+        "read_pool_size": 8,
+    },
+    "agent": {
+        "extra_bots": [],
+        "verdict_cache_size": 256,
+    },
+    "cache": {
+        "sweep_interval": 300,
+        "sweep_batch_size": 500,
+        "stale_while_revalidate": 600,
+        "stale_if_error": 86400,
+        "write_queue_size": 10000,
+        "write_batch_size": 256,
+        "ttl": {
+            "default": {"text": 86400, "image": 86400, "video": 86400},
+            # TikTok's play_addr urls stop working long before a day is up.
+            "TikTok": {"video": 3600},
+        },
+    },
+    "memory_cache": {
+        "max_entries": 1024,
+        "max_bytes": 32 * 1024 * 1024,
+    },
+    "http_cache": {
+        # Redirects only depend on the url, so they never go stale.
+        "redirect_max_age": 86400,
+        "oembed_max_age": 365 * 86400,
+    },
+    "negative_cache": {
+        "max_entries": 4096,
+        "ttl": {
+            # Deleted posts and invalid IDs won't come back any time soon.
+            "400": 3600,
+            "404": 3600,
+            "4xx": 300,
+            # Upstream errors and timeouts usually clear up quickly, so only shield them from retry storms.
+            "5xx": 15,
+            # Unavailable upstreams, like Twitter without a guest session, are left to the circuit breaker.
+            "503": 0,
+        },
+    },
+    "extractor": {
+        "mode": "thread",
+        "workers": 4,
+        "timeout": 30,
+    },
+    "clients": {
+        "default": {
+            "limit": 100,
+            "limit_per_host": 20,
+            "keepalive_timeout": 30,
+            "ttl_dns_cache": 300,
+            "timeout": 30,
+            "connect_timeout": 5,
+            "resolve": {},
+        },
+        "tiktok": {"timeout": 10},
+        "twitter": {"timeout": 10},
+    },
+    "resilience": {
+        "default": {
+            "failure_threshold": 5,
+            "reset_timeout": 30,
+            "initial_limit": 20,
+            "min_limit": 2,
+            "max_limit": 100,
+            "backoff": 0.5,
+            "queue_timeout": 1,
+        },
+    },
+    "twitter": {
+        "api_url": "https://api.twitter.com",
+        "graphql_url": "https://twitter.com/i/api/graphql",
+        "sessions": 3,
+        # Twitter invalidates guest sessions after 3h.
+        "session_lifetime": 2.5 * 60 * 60,
+        "session_wait": 2,
+        "batch_window": 0.01,
+        "batch_size": 20,
+    },
+    "tiktok": {
+        "api_url": "https://api22-normal-c-useast2a.tiktokv.com/aweme/v1/feed/",
+        "app_install_ids": [
+            "7351144126450059040",
+            "7351149742343391009",
+            "7351153174894626592",
+        ],
+        "hedge_percentile": 0.9,
+        "hedge_min_delay": 0.1,
+        "hedge_initial_delay": 1.0,
+        "short_link_cache_size": 4096,
+    },
+    "deadline": {
+        # Crawlers like Discord's give up after a few seconds.
+        "request": 8,
+        "stages": {"short_link": 3, "api": 6, "extract": 8},
+    },
+    "batch": {
+        "max_urls": 100,
+        # Twitter lookups are batched into one request anyway, so let a whole batch's worth through.
+        "concurrency": {"default": 4, "Twitter": 20},
+    },
+    "fixtures": {
+        "mode": "off",
+        "directory": "fixtures",
+    },
+}
+
+
+def _merge(defaults: dict[str, Any], overrides: dict[str, Any]) -> dict[str, Any]:
+    merged = dict(defaults)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
 
 
 def _load_config() -> Config:
-    with open("config.toml") as fp:
+    with open(os.environ.get("EMBEDIT_CONFIG", "config.toml")) as fp:
         text = fp.read()
-    return tomllib.loads(text)  # type: ignore - it's loading the config.
+    return _merge(_DEFAULTS, tomllib.loads(text))  # type: ignore - it's loading the config.
 
 
 CONFIG = _load_config()
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import sqlite3
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+import asqlite
+
+from .config import CONFIG
+from .metrics import db_wait
+
+__all__ = ("Database", "PoolStats", "database")
+
+logger = logging.getLogger(__name__)
+
+# WAL (which asqlite turns on) lets reads carry on while the writer is writing, and makes
+# ``synchronous=NORMAL`` safe. The rest keep more of the database in memory.
+_pragmas = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA busy_timeout = 5000",
+)
+
+
+def _tune(conn: sqlite3.Connection) -> None:
+    for pragma in _pragmas:
+        conn.execute(pragma)
+
+
+@dataclass
+class PoolStats:
+    """How long connections took to get from one of the database's paths."""
+
+    acquisitions: int = 0
+    waiting: int = 0
+    """How many connections are being waited on right now."""
+    total_wait: float = 0
+    """The total time, in seconds, spent waiting on connections."""
+    max_wait: float = 0
+    """The longest time, in seconds, spent waiting on a connection."""
+
+    def record(self, wait: float) -> None:
+        self.acquisitions += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+
+class Database:
+    """The cache database, with separate paths for reading and writing.
+
+    Reads go through a pool of ``read_pool_size`` connections, and should only hold one for as
+    long as their queries take. Writes all go through a single connection, one at a time, so
+    they never fight over sqlite's write lock and never take a connection from readers.
+
+    Args:
+        file (str): The database file.
+        read_pool_size (int): How many connections the read pool has.
+    """
+
+    def __init__(self, file: str, *, read_pool_size: int) -> None:
+        self.file = file
+        self.read_pool_size = read_pool_size
+        self.read_stats = PoolStats()
+        self.write_stats = PoolStats()
+        self._pool: asqlite.Pool | None = None
+        self._writer: asqlite.Connection | None = None
+        self._write_lock = asyncio.Lock()
+
+    async def open(self) -> None:
+        logger.info("opening %s with %d read connections.", self.file, self.read_pool_size)
+        self._writer = await asqlite.connect(self.file, init=_tune)
+        self._pool = await asqlite.create_pool(self.file, size=self.read_pool_size, init=_tune)
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+        if self._writer is not None:
+            await self._writer.close()
+            self._writer = None
+
+    @asynccontextmanager
+    async def read(self) -> AsyncIterator[asqlite.Connection]:
+        """Borrows a connection from the read pool. Don't write with it, or hold it across anything slow."""
+        if self._pool is None:
+            raise RuntimeError("the database hasn't been opened.")  # noqa: TRY003
+        async with self._timed(self.read_stats, "read"):
+            conn = await self._pool.acquire()
+        try:
+            yield conn
+        finally:
+            await self._pool.release(conn)
+
+    @asynccontextmanager
+    async def write(self) -> AsyncIterator[asqlite.Connection]:
+        """Takes the write connection, waiting for any other writes to finish first."""
+        if self._writer is None:
+            raise RuntimeError("the database hasn't been opened.")  # noqa: TRY003
+        async with self._timed(self.write_stats, "write"):
+            await self._write_lock.acquire()
+        try:
+            yield self._writer
+        finally:
+            self._write_lock.release()
+
+    def stats(self) -> dict[str, PoolStats]:
+        return {"read": self.read_stats, "write": self.write_stats}
+
+    @asynccontextmanager
+    async def _timed(self, stats: PoolStats, path: str) -> AsyncIterator[None]:
+        stats.waiting += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats.waiting -= 1
+        wait = time.perf_counter() - start
+        stats.record(wait)
+        db_wait.labels(path).observe(wait)
+
+
+database = Database(CONFIG["sqlite"]["file"], read_pool_size=CONFIG["sqlite"]["read_pool_size"])
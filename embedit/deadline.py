@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections.abc import AsyncIterator, Awaitable
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, TypeVar
+
+from fastapi import HTTPException
+
+from .config import CONFIG
+from .metrics import client_disconnects, deadline_timeouts
+
+if TYPE_CHECKING:
+    from starlette.requests import Request
+
+__all__ = ("ClientDisconnected", "Deadline", "DeadlineExceeded", "cancel_on_disconnect")
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class ClientDisconnected(HTTPException):
+    """Raised when the client went away before its request was answered."""
+
+    def __init__(self) -> None:
+        # The status nginx uses for this, which the client will never see.
+        super().__init__(499, detail="Client Closed Request")
+
+
+class DeadlineExceeded(HTTPException):
+    """Raised when a stage of a request runs out of time.
+
+    This says that one request ran out of budget rather than anything about the post, so it
+    is never remembered by the negative cache.
+
+    Args:
+        stage (str): The stage that ran out of time.
+        detail (str): What happened, for the response.
+        slow_upstream (bool): Whether the stage used up the whole of its own limit, which means
+            its upstream was too slow, rather than just what was left of the request's budget.
+    """
+
+    def __init__(self, stage: str, detail: str, *, slow_upstream: bool) -> None:
+        super().__init__(504, detail=detail)
+        self.stage = stage
+        self.slow_upstream = slow_upstream
+
+
+class Deadline:
+    """The time budget of a request, shared by every stage of answering it.
+
+    Providers take a deadline in :meth:`Provider.parse` and run each upstream call as a
+    :meth:`stage`, which gets whatever is left of the budget, capped by that stage's own
+    limit in the ``[deadline.stages]`` config. Work still running when its time is up is
+    cancelled, instead of continuing for a client that gave up on it long ago.
+
+    Args:
+        budget (float): How long, in seconds, the request may take from now.
+        stages (dict[str, float] | None): Stage name to the most time, in seconds, it may take.
+            Defaults to the ``[deadline.stages]`` config.
+    """
+
+    __slots__ = ("expires", "stages")
+
+    def __init__(self, budget: float, *, stages: dict[str, float] | None = None) -> None:
+        self.expires = asyncio.get_running_loop().time() + budget
+        self.stages = CONFIG["deadline"]["stages"] if stages is None else stages
+
+    @classmethod
+    def default(cls) -> Deadline:
+        """Gets a deadline with the ``[deadline]`` config's budget for a whole request."""
+        return cls(CONFIG["deadline"]["request"])
+
+    def remaining(self) -> float:
+        """Gets how long, in seconds, is left of the budget. This is negative once it has run out."""
+        return self.expires - asyncio.get_running_loop().time()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    @asynccontextmanager
+    async def stage(self, name: str) -> AsyncIterator[None]:
+        """Runs a stage of the request within the budget.
+
+        Args:
+            name (str): The stage, like ``api``. Its limit, if it has one, is looked up in :attr:`stages`.
+
+        Raises:
+            DeadlineExceeded: If the stage runs out of time, in which case it is cancelled.
+        """
+        remaining = self.remaining()
+        limit = self.stages.get(name)
+        timeout = remaining if limit is None else min(remaining, limit)
+        if timeout <= 0:
+            deadline_timeouts.labels(name).inc()
+            raise DeadlineExceeded(name, f"ran out of time before {name}.", slow_upstream=False)
+
+        try:
+            async with asyncio.timeout(timeout):
+                yield
+        except TimeoutError:
+            deadline_timeouts.labels(name).inc()
+            logger.info("the %s stage timed out after %.2fs.", name, timeout)
+            raise DeadlineExceeded(
+                name, f"timed out during {name}.", slow_upstream=limit is not None and limit <= remaining
+            ) from None
+
+
+async def cancel_on_disconnect(request: Request, aw: Awaitable[T], *, interval: float = 0.25) -> T:
+    """Awaits ``aw``, cancelling it if the client disconnects first.
+
+    Args:
+        request (Request): The client's request.
+        aw (Awaitable[T]): What the client is waiting for.
+        interval (float): How often, in seconds, to check whether the client is still there.
+
+    Raises:
+        ClientDisconnected: If the client disconnected.
+
+    Returns:
+        T: The result of ``aw``.
+    """
+    task = asyncio.ensure_future(aw)
+    try:
+        while True:
+            done, _ = await asyncio.wait((task,), timeout=interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                client_disconnects.inc()
+                logger.debug("client disconnected from %s, cancelling it.", request.url.path)
+                raise ClientDisconnected
+    finally:
+        if not task.done():
+            task.cancel()
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from fastapi import HTTPException
+
+from .config import CONFIG
+from .writer import cache_writer
+
+if TYPE_CHECKING:
+    import asqlite
+
+    from .db import Database
+
+__all__ = ("Failure", "FailureCache", "failures")
+
+logger = logging.getLogger(__name__)
+
+_UPSERT = (
+    "INSERT INTO failures(url, status, detail, expiry) VALUES(?, ?, ?, ?) "
+    "ON CONFLICT(url) DO UPDATE SET status = excluded.status, detail = excluded.detail, expiry = excluded.expiry"
+)
+
+
+@dataclass(slots=True)
+class Failure:
+    """A lookup that failed upstream."""
+
+    status: int
+    detail: str | None
+    expiry: float
+
+    def exception(self) -> HTTPException:
+        """Gets the exception to answer the lookup with. Transient failures say when to retry."""
+        headers = None
+        if self.status >= 500:
+            headers = {"Retry-After": str(max(1, round(self.expiry - time.time())))}
+        return HTTPException(self.status, detail=self.detail, headers=headers)
+
+
+class FailureCache:
+    """Remembers lookups that failed upstream for a short while, so retries are answered locally.
+
+    How long a failure is remembered depends on its status, so that a deleted post (a 404) can be
+    remembered for much longer than an upstream having a bad moment (a 503). Statuses without a ttl
+    aren't remembered at all. Like :class:`embedit.providers.tiktok.links.ShortLinks`, failures are
+    stored in the ``failures`` table with an in-memory LRU in front of it.
+
+    Args:
+        max_entries (int): How many failures are kept in memory.
+        ttls (dict[str, float]): Status code, or a class like ``5xx``, to how long in seconds a
+            failure with it is remembered for.
+    """
+
+    def __init__(self, *, max_entries: int, ttls: dict[str, float]) -> None:
+        self.max_entries = max_entries
+        self.ttls = ttls
+        self._db: Database | None = None
+        self._failures: OrderedDict[str, Failure] = OrderedDict()
+
+    def bind(self, db: Database) -> None:
+        """Sets the database failures are stored in. Until this is called, they are only kept in memory."""
+        self._db = db
+
+    def ttl_for(self, status: int) -> float:
+        """Gets how long, in seconds, a failure with the status is remembered for. ``0`` if it isn't."""
+        return self.ttls.get(str(status), self.ttls.get(f"{status // 100}xx", 0))
+
+    def peek(self, key: str) -> Failure | None:
+        """Gets the failure for the key if it is in memory, without touching the database."""
+        failure = self._failures.get(key)
+        if failure is not None and failure.expiry <= time.time():
+            del self._failures[key]
+            return None
+        return failure
+
+    async def get(self, key: str) -> Failure | None:
+        """Gets the failure remembered for the key, if it hasn't expired.
+
+        Args:
+            key (str): The cache key of the lookup, see :meth:`Provider.canonicalize`.
+
+        Returns:
+            Failure | None: The failure.
+        """
+        if (failure := self.peek(key)) is not None:
+            self._failures.move_to_end(key)
+            return failure
+        if self._db is None:
+            return None
+
+        async with self._db.read() as conn, conn.cursor() as cursor:
+            res = await cursor.execute(
+                "SELECT status, detail, expiry FROM failures WHERE url = ? AND expiry > ?", key, time.time()
+            )
+            row = await res.fetchone()
+        if not row:
+            return None
+        failure = Failure(status=row["status"], detail=row["detail"], expiry=row["expiry"])
+        self._remember(key, failure)
+        return failure
+
+    def record(self, key: str, status: int, detail: str | None = None) -> None:
+        """Remembers that the lookup failed with the status, if failures with it are remembered at all.
+
+        The failure is remembered in memory straight away, and stored in the database by
+        :data:`embedit.writer.cache_writer` in the background, so the lookup isn't held up by it.
+        """
+        ttl = self.ttl_for(status)
+        if ttl <= 0:
+            return
+
+        failure = Failure(status=status, detail=detail, expiry=time.time() + ttl)
+        logger.debug("remembering that %s failed with status %d for %ss.", key, status, ttl)
+        self._remember(key, failure)
+        if self._db is not None:
+            cache_writer.submit_row(_UPSERT, key, (key, failure.status, failure.detail, failure.expiry))
+
+    async def sweep(self, conn: asqlite.Connection) -> int:
+        """Deletes every expired failure from the database, returning how many were removed."""
+        async with conn.cursor() as cursor:
+            await cursor.execute("DELETE FROM failures WHERE expiry <= ?", time.time())
+            return cursor.get_cursor().rowcount
+
+    def _remember(self, key: str, failure: Failure) -> None:
+        self._failures[key] = failure
+        self._failures.move_to_end(key)
+        while len(self._failures) > self.max_entries:
+            self._failures.popitem(last=False)
+
+
+failures = FailureCache(
+    max_entries=CONFIG["negative_cache"]["max_entries"],
+    ttls=CONFIG["negative_cache"]["ttl"],
+)
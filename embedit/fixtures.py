@@ -0,0 +1,186 @@
+"""Records what the upstreams answered to fixture files, and replays them without the network.
+
+Fixtures are taken at the two boundaries providers fetch through: the ``aiohttp`` sessions
+handed out by :data:`embedit.clients.clients`, and yt-dlp extraction in
+:data:`embedit.providers.extractor.extractor`. The ``[fixtures]`` config's ``mode`` picks
+what happens there:
+
+- ``off``: requests go to the upstreams, and nothing is recorded.
+- ``record``: requests go to the upstreams, and every response is saved to ``directory``.
+- ``replay``: requests never leave the process. Every response comes from ``directory``,
+  and a request that was never recorded fails with :class:`MissingFixture`.
+
+A request is identified by its method and url, so replaying it gives back the exact same
+bytes every time. Query parameters that change between requests for the same thing, like
+TikTok's device IDs and timestamps, are left out of the url a fixture is looked up by; see
+``fixture_params`` on :meth:`embedit.clients.HTTPClients.register`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from collections.abc import AsyncIterator, Mapping
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Literal
+
+import aiohttp
+import yarl
+from multidict import CIMultiDict, CIMultiDictProxy
+
+from .config import CONFIG
+
+__all__ = ("FixtureResponse", "FixtureSession", "FixtureStore", "MissingFixture", "fixtures")
+
+logger = logging.getLogger(__name__)
+
+
+class MissingFixture(LookupError):
+    """Raised in replay mode when a request was never recorded."""
+
+    def __init__(self, upstream: str, key: str) -> None:
+        super().__init__(f"no {upstream} fixture was recorded for {key}.")
+        self.upstream = upstream
+        self.key = key
+
+
+class FixtureStore:
+    """Reads and writes fixtures, one JSON file per request.
+
+    Files are stored at ``<directory>/<upstream>/<hash of the key>.json``, and keep the key
+    they were recorded for so they can be told apart by hand.
+
+    Args:
+        directory (str | Path): Where fixtures are kept.
+        mode (Literal["off", "record", "replay"]): Whether fixtures are recorded, replayed or neither.
+    """
+
+    def __init__(self, directory: str | Path, *, mode: Literal["off", "record", "replay"]) -> None:
+        self.directory = Path(directory)
+        self.mode = mode
+        # Replays are read from disk once, so replaying costs the same as the upstream answering instantly.
+        self._loaded: dict[tuple[str, str], dict[str, Any]] = {}
+
+    def path(self, upstream: str, key: str) -> Path:
+        return self.directory / upstream / f"{hashlib.sha256(key.encode()).hexdigest()[:16]}.json"
+
+    def load(self, upstream: str, key: str) -> dict[str, Any]:
+        """Loads the fixture recorded for the key.
+
+        Raises:
+            MissingFixture: If nothing was recorded for it.
+        """
+        if (response := self._loaded.get((upstream, key))) is not None:
+            return response
+        try:
+            with open(self.path(upstream, key), encoding="utf-8") as fp:
+                response = self._loaded[upstream, key] = json.load(fp)["response"]
+        except FileNotFoundError:
+            raise MissingFixture(upstream, key) from None
+        return response
+
+    def save(self, upstream: str, key: str, response: Any) -> None:
+        path = self.path(upstream, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fp:
+            json.dump({"key": key, "response": response}, fp, indent=2, ensure_ascii=False)
+            fp.write("\n")
+        logger.debug("recorded a %s fixture for %s.", upstream, key)
+
+    def session(
+        self, upstream: str, session: aiohttp.ClientSession, *, params: tuple[str, ...] | None = None
+    ) -> FixtureSession:
+        """Wraps an upstream's session, so its requests are recorded or replayed.
+
+        Args:
+            upstream (str): The upstream's name, which its fixtures are grouped under.
+            session (aiohttp.ClientSession): The session requests go through when recording.
+            params (tuple[str, ...] | None): The query parameters that identify a request,
+                or ``None`` if all of them do.
+        """
+        return FixtureSession(self, upstream, session, params=params)
+
+
+def _request_key(
+    method: str, url: str | yarl.URL, params: Mapping[str, Any] | None, keep: tuple[str, ...] | None
+) -> str:
+    """Gets the key a request's fixture is stored under: its method, and its url with only the ``keep`` parameters."""
+    url = yarl.URL(url)
+    if params:
+        url = url.update_query({key: str(value) for key, value in params.items()})
+    query = sorted((key, value) for key, value in url.query.items() if keep is None or key in keep)
+    return f"{method.upper()} {url.with_query(query)}"
+
+
+class FixtureResponse:
+    """A recorded response, with the parts of :class:`aiohttp.ClientResponse` that providers use."""
+
+    def __init__(self, method: str, url: yarl.URL, data: dict[str, Any]) -> None:
+        self.method = method
+        self.url = url
+        self.status: int = data["status"]
+        self.headers = CIMultiDictProxy(CIMultiDict(data["headers"]))
+        self._body: str = data["body"]
+
+    async def read(self) -> bytes:
+        return self._body.encode()
+
+    async def text(self) -> str:
+        return self._body
+
+    async def json(self, **kwargs: Any) -> Any:
+        return json.loads(self._body)
+
+    def raise_for_status(self) -> None:
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(
+                aiohttp.RequestInfo(self.url, self.method, CIMultiDictProxy(CIMultiDict()), self.url),
+                (),
+                status=self.status,
+                headers=self.headers,
+            )
+
+
+class FixtureSession:
+    """Stands in for an :class:`aiohttp.ClientSession`, recording or replaying its ``get`` and ``post``."""
+
+    def __init__(
+        self,
+        store: FixtureStore,
+        upstream: str,
+        session: aiohttp.ClientSession,
+        *,
+        params: tuple[str, ...] | None,
+    ) -> None:
+        self.store = store
+        self.upstream = upstream
+        self.params = params
+        self._session = session
+
+    def get(self, url: str | yarl.URL, **kwargs: Any) -> Any:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str | yarl.URL, **kwargs: Any) -> Any:
+        return self.request("POST", url, **kwargs)
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str | yarl.URL, **kwargs: Any) -> AsyncIterator[FixtureResponse]:
+        key = _request_key(method, url, kwargs.get("params"), self.params)
+        if self.store.mode == "replay":
+            yield FixtureResponse(method, yarl.URL(url), self.store.load(self.upstream, key))
+            return
+
+        async with self._session.request(method, url, **kwargs) as res:
+            data = {
+                "status": res.status,
+                "headers": list(res.headers.items()),
+                "body": await res.text(errors="replace"),
+            }
+            real_url = res.url
+        self.store.save(self.upstream, key, data)
+        yield FixtureResponse(method, real_url, data)
+
+
+fixtures = FixtureStore(CONFIG["fixtures"]["directory"], mode=CONFIG["fixtures"]["mode"])
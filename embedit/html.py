@@ -70,11 +70,15 @@ def generate_meta_tag(
 
 
 def generate_html(head_children: list[str], body_children: list[str] | None) -> str:
-    head_children.append(generate_meta_tag(value="text/html; charset=UTF-8", extras={"http-equiv": "Content-Type"}))
+    # Copy the children, so the caller's lists aren't modified.
+    head_children = [
+        *head_children,
+        generate_meta_tag(value="text/html; charset=UTF-8", extras={"http-equiv": "Content-Type"}),
+    ]
     if not body_children:
         body_children = [header_to_text(head_children)]
     else:
-        body_children.append(header_to_text(head_children))
+        body_children = [*body_children, header_to_text(head_children)]
 
     html = generate_tag("!DOCTYPE", "html")
     meta = generate_tag("head", children="\n".join(head_children))
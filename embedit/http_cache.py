@@ -0,0 +1,144 @@
+"""HTTP caching headers, so repeat requests can be answered by clients and proxies in front of us.
+
+Embed pages are sent with an ``ETag`` (a hash of the page), a ``Last-Modified`` (when the post was
+fetched) and a ``Cache-Control`` max-age of however long their cache entry has left, along with what
+is left of the ``stale-while-revalidate`` and ``stale-if-error`` windows we would serve it in anyway.
+Conditional requests whose copy is still current are answered with a bodiless 304.
+
+Bots get the embed page and everyone else a redirect to the post (see :func:`embedit.agent.is_bot`),
+so both vary on the ``User-Agent`` and a shared cache never hands one to the other. Redirects carry
+no validators: they have no body worth revalidating, and a bot's ETag must never turn someone's
+request into a 304.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import TYPE_CHECKING
+
+from starlette.responses import Response
+
+from .config import CONFIG
+from .metrics import not_modified_responses
+
+if TYPE_CHECKING:
+    from starlette.datastructures import Headers
+    from starlette.requests import Request
+
+    from .lru import RenderedPage
+
+__all__ = (
+    "VARY",
+    "cache_control",
+    "conditional",
+    "embed_headers",
+    "etag_for",
+    "is_not_modified",
+    "redirect_headers",
+)
+
+VARY = "User-Agent"
+"""What every embed response varies on."""
+
+
+def etag_for(body: bytes) -> str:
+    """Gets a strong ETag for the body, which only changes when the body does."""
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def cache_control(max_age: float, *, stale_while_revalidate: float = 0, stale_if_error: float = 0) -> str:
+    """Gets a ``Cache-Control`` header that lets shared caches keep a response.
+
+    Args:
+        max_age (float): How long, in seconds, the response is fresh for.
+        stale_while_revalidate (float): How long, in seconds, after that it may still be served while
+            it is revalidated.
+        stale_if_error (float): How long, in seconds, after that it may still be served if
+            revalidating it fails.
+    """
+    directives = [f"public, max-age={max(0, int(max_age))}"]
+    if stale_while_revalidate >= 1:
+        directives.append(f"stale-while-revalidate={int(stale_while_revalidate)}")
+    if stale_if_error >= 1:
+        directives.append(f"stale-if-error={int(stale_if_error)}")
+    return ", ".join(directives)
+
+
+def embed_headers(page: RenderedPage) -> dict[str, str]:
+    """Gets the caching headers of an embed page, with a max-age of however long its cache entry has left."""
+    config = CONFIG["cache"]
+    remaining = page.expiry - time.time()
+    # A page that is already stale only has what is left of the stale windows.
+    overdue = max(0, -remaining)
+    return {
+        "Cache-Control": cache_control(
+            remaining,
+            stale_while_revalidate=config["stale_while_revalidate"] - overdue,
+            stale_if_error=config["stale_if_error"] - overdue,
+        ),
+        "ETag": page.etag,
+        "Last-Modified": formatdate(page.modified, usegmt=True),
+        "Vary": VARY,
+    }
+
+
+def redirect_headers() -> dict[str, str]:
+    """Gets the caching headers of the redirect people get instead of the embed page."""
+    return {"Cache-Control": cache_control(CONFIG["http_cache"]["redirect_max_age"]), "Vary": VARY}
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # Weak comparison, since proxies that compress a response weaken its ETag.
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def is_not_modified(headers: Headers, *, etag: str, last_modified: float | None = None) -> bool:
+    """Gets whether a conditional request's copy of a response is still current.
+
+    ``If-None-Match`` is checked if it was sent, and ``If-Modified-Since`` otherwise, as RFC 9110 says.
+
+    Args:
+        headers (Headers): The request's headers.
+        etag (str): The response's ETag.
+        last_modified (float | None): The unix timestamp the response last changed at, if it is known.
+    """
+    if (if_none_match := headers.get("If-None-Match")) is not None:
+        return _etag_matches(if_none_match, etag)
+    if last_modified is None or (if_modified_since := headers.get("If-Modified-Since")) is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates only go down to the second.
+    return int(last_modified) <= since
+
+
+def conditional(
+    request: Request,
+    body: bytes,
+    headers: dict[str, str],
+    *,
+    media_type: str,
+    endpoint: str,
+    last_modified: float | None = None,
+) -> Response:
+    """Answers with the body, or with a 304 if the request's copy of it is still current.
+
+    Args:
+        request (Request): The request.
+        body (bytes): The response's body.
+        headers (dict[str, str]): The response's headers, which must include its ``ETag``.
+            A 304 is sent with them too.
+        media_type (str): The response's content type.
+        endpoint (str): The endpoint answering, for metrics.
+        last_modified (float | None): The unix timestamp the response last changed at, if it is known.
+    """
+    if is_not_modified(request.headers, etag=headers["ETag"], last_modified=last_modified):
+        not_modified_responses.labels(endpoint).inc()
+        return Response(status_code=304, headers=headers)
+    return Response(body, headers=headers, media_type=media_type)
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from .config import CONFIG
+from .http_cache import etag_for
+
+__all__ = ("RenderCache", "RenderedPage", "render_cache")
+
+
+class RenderedPage(NamedTuple):
+    """A rendered embed page, with the validators conditional requests for it are checked against."""
+
+    body: bytes
+    expiry: float
+    """The unix timestamp the page expires at, which matches its sqlite row."""
+    modified: float
+    """The unix timestamp the page's data was fetched at."""
+    etag: str
+
+    @classmethod
+    def create(cls, body: bytes, *, expiry: float, modified: float) -> RenderedPage:
+        """Creates a page, hashing its body for the ETag once so that hits don't have to."""
+        return cls(body, expiry, modified, etag_for(body))
+
+
+class RenderCache:
+    """An in-process LRU of fully rendered embed pages, keyed by url.
+
+    This sits in front of the sqlite cache so that a hit never touches the pool,
+    the database or the renderer. Entries expire at the same time as their
+    sqlite row and the cache is bounded both by entry count and total body size.
+    """
+
+    def __init__(self, *, max_entries: int, max_bytes: int) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = 0
+        self._entries: OrderedDict[str, RenderedPage] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """int: The total size, in bytes, of every cached body."""
+        return self._size
+
+    def get(self, url: str) -> RenderedPage | None:
+        """Gets the rendered page for the given url, if it is cached and not expired.
+
+        Args:
+            url (str): The url the page was rendered for.
+
+        Returns:
+            RenderedPage | None: The rendered page.
+        """
+        entry = self._entries.get(url)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expiry <= time.time():
+            self._remove(url)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(url)
+        self.hits += 1
+        return entry
+
+    def put(self, url: str, page: RenderedPage) -> None:
+        """Caches a rendered page until it expires, evicting the least recently used pages if needed.
+
+        Args:
+            url (str): The url the page was rendered for.
+            page (RenderedPage): The rendered page.
+        """
+        if len(page.body) > self.max_bytes or page.expiry <= time.time():
+            return
+
+        if url in self._entries:
+            self._remove(url)
+        self._entries[url] = page
+        self._size += len(page.body)
+
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, url: str) -> None:
+        if url in self._entries:
+            self._remove(url)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+    def _remove(self, url: str) -> None:
+        entry = self._entries.pop(url)
+        self._size -= len(entry.body)
+
+
+render_cache = RenderCache(
+    max_entries=CONFIG["memory_cache"]["max_entries"],
+    max_bytes=CONFIG["memory_cache"]["max_bytes"],
+)
@@ -1,16 +1,40 @@
+from __future__ import annotations
+
 import abc
 import base64
+import hashlib
 import html
 from dataclasses import dataclass
+from operator import attrgetter
+from pathlib import Path
+from typing import ClassVar
 
 from .config import CONFIG
-from .html import generate_attribute, generate_meta_tag, generate_tag
+from .html import generate_attribute, generate_html, generate_meta_tag, generate_tag
+from .render import Template, meta, optional_meta, static
+
+
+def _render_version() -> str:
+    # Pages are rendered from this file, ``html.py``, ``render.py`` and a couple of config values,
+    # so a change to any of them invalidates pages rendered before it.
+    digest = hashlib.blake2b(digest_size=8)
+    here = Path(__file__)
+    for path in (here, here.with_name("html.py"), here.with_name("render.py")):
+        digest.update(path.read_bytes())
+    digest.update(CONFIG["url"].encode())
+    digest.update(CONFIG["color"].encode())
+    return digest.hexdigest()
+
+
+RENDER_VERSION = _render_version()
+"""A hash of everything that goes into rendering a page. Cached pages rendered under a different version are stale."""
 
 # I would like to have used ``NamedTuple`` here, but it seems that might not
-# be possible with inheritance.
+# be possible with inheritance. Slots keep them about as small.
+# Zero argument ``super()`` doesn't work in slotted dataclasses, so parents are called explicitly.
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class OpenGraphBaseData(abc.ABC):
     title: str
     description: str
@@ -19,6 +43,9 @@ class OpenGraphBaseData(abc.ABC):
     author_name: str
     author_url: str
 
+    template: ClassVar[Template | None] = None
+    """The precompiled page for this class. This must render the same tags as :meth:`to_meta`."""
+
     @abc.abstractmethod
     def to_type(self) -> str: ...
 
@@ -41,16 +68,50 @@ class OpenGraphBaseData(abc.ABC):
 
         return meta
 
+    def to_html(self) -> str:
+        """Renders the full embed page for this data.
+
+        Returns:
+            str: The page.
+        """
+        # Only use a template defined on this exact class, as a subclass may have changed ``to_meta``.
+        template: Template | None = type(self).__dict__.get("template")
+        if template is None:
+            return generate_html(head_children=self.to_meta(), body_children=None)
+        return template.render(self)
+
 
-@dataclass(kw_only=True)
+def _ograph_link(data: OpenGraphVideoData) -> str:
+    author_name = str(base64.b64encode(data.author_name.encode()), "utf-8")
+    href = f"{CONFIG['url']}/ograph/?author_name={author_name}&title={data.title}&url={data.url}"
+    return f'<link rel="alternate" href="{href}" />'
+
+
+_base_template = Template(
+    meta("theme-color", lambda data: data.color or CONFIG["color"]),
+    meta("og:description", lambda data: html.escape(data.description) if data.title == "Twitter" else None),
+    lambda data: f'<meta content="content = 0; url = {data.url}" http-equiv="refresh" />',
+    meta("og:site_name", lambda data: f"Embedit - {data.title}"),
+    meta("og:url", attrgetter("url")),
+)
+
+
+@dataclass(kw_only=True, slots=True)
 class OpenGraphTextData(OpenGraphBaseData):
     author_avatar: str | None = None
 
+    template = _base_template + Template(
+        static('<meta property="og:type" content="website" />'),
+        meta("og:title", attrgetter("author_name")),
+        optional_meta("og:image", attrgetter("author_avatar")),
+        optional_meta("twitter:image", attrgetter("author_avatar")),
+    )
+
     def to_type(self) -> str:
         return "text"
 
     def to_meta(self) -> list[str]:
-        meta = super().to_meta()
+        meta = OpenGraphBaseData.to_meta(self)
         meta += [
             generate_meta_tag(prop="og:type", value="website"),
             generate_meta_tag(prop="og:title", value=self.author_name),
@@ -65,17 +126,29 @@ class OpenGraphTextData(OpenGraphBaseData):
         return meta
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class OpenGraphImageData(OpenGraphBaseData):
     media_url: str
     width: int
     height: int
 
+    template = _base_template + Template(
+        static('<meta property="og:type" content="website" />'),
+        meta("og:title", attrgetter("author_name")),
+        static('<meta property="twitter:card" content="summary_large_image" />'),
+        meta("twitter:card:image", attrgetter("media_url")),
+        meta("twitter:card:height", attrgetter("height")),
+        meta("twitter:card:width", attrgetter("width")),
+        meta("og:image", attrgetter("media_url")),
+        meta("og:image:height", attrgetter("height")),
+        meta("og:image:width", attrgetter("width")),
+    )
+
     def to_type(self) -> str:
         return "image"
 
     def to_meta(self) -> list[str]:
-        meta = super().to_meta()
+        meta = OpenGraphBaseData.to_meta(self)
         meta += [
             generate_meta_tag(prop="og:type", value="website"),
             generate_meta_tag(prop="og:title", value=self.author_name),
@@ -91,11 +164,22 @@ class OpenGraphImageData(OpenGraphBaseData):
         return meta
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class OpenGraphVideoData(OpenGraphImageData):
     thumbnail_url: str
     extra_video_url: str | None = None
 
+    template = _base_template + Template(
+        static('<meta property="og:type" content="video.other" />'),
+        meta("og:video", attrgetter("media_url")),
+        static('<meta property="og:video:type" content="video/mp4" />'),
+        meta("og:video:width", attrgetter("width")),
+        meta("og:video:height", attrgetter("height")),
+        meta("og:title", attrgetter("author_name")),
+        meta("og:image", attrgetter("thumbnail_url")),
+        _ograph_link,
+    )
+
     def to_type(self) -> str:
         return "video"
 
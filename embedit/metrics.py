@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import abc
+import bisect
+import math
+from collections.abc import Iterator
+from typing import ClassVar, Generic, TypeVar
+
+__all__ = (
+    "CONTENT_TYPE",
+    "DEFAULT_BUCKETS",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "Registry",
+    "cache_hit_ratio",
+    "cache_lookups",
+    "client_connections",
+    "client_disconnects",
+    "client_reused",
+    "db_wait",
+    "deadline_timeouts",
+    "extractor_duration",
+    "extractor_errors",
+    "inflight_fetches",
+    "not_modified_responses",
+    "registry",
+    "request_duration",
+    "requests_in_flight",
+    "upstream_breaker_state",
+    "upstream_duration",
+    "upstream_errors",
+    "upstream_limit",
+    "upstream_rejections",
+    "writer_queue",
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+"""The content type of the Prometheus text format."""
+
+# Seconds, from a memory cache hit up to a slow upstream.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+C = TypeVar("C")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Registry:
+    """Holds every metric, and renders them in the Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class _Metric(abc.ABC, Generic[C]):
+    type: ClassVar[str]
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: dict[tuple[str, ...], C] = {}
+        registry.register(self)
+
+    def labels(self, *values: str) -> C:
+        """Gets the child for the given label values, in the order of ``labelnames``."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes the labels {self.labelnames}.")  # noqa: TRY003
+            child = self._children[values] = self._child()
+        return child
+
+    @abc.abstractmethod
+    def _child(self) -> C:
+        """Creates the child for a new set of label values."""
+
+    def _label_str(self, values: tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values, strict=True)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    @abc.abstractmethod
+    def samples(self) -> Iterator[str]:
+        """Renders every child's samples in the Prometheus text format."""
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _Scalar(_Metric[_Value]):
+    def _child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def samples(self) -> Iterator[str]:
+        for values, child in self._children.items():
+            yield f"{self.name}{self._label_str(values)} {_format(child.value)}"
+
+
+class Counter(_Scalar):
+    """A value that only goes up, like the amount of requests served."""
+
+    type = "counter"
+
+
+class Gauge(_Scalar):
+    """A value that goes up and down, like the amount of requests in flight."""
+
+    type = "gauge"
+
+    def dec(self, amount: float = 1) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class _Buckets:
+    __slots__ = ("bounds", "count", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric[_Buckets]):
+    """Counts observations, like request latencies, into buckets.
+
+    Observing is a binary search and three additions, so it is cheap enough to do on every request.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        *,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _child(self) -> _Buckets:
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def samples(self) -> Iterator[str]:
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), child.counts, strict=True):
+                cumulative += count
+                le = f'le="{_format(bound)}"'
+                yield f"{self.name}_bucket{self._label_str(values, le)} {cumulative}"
+            yield f"{self.name}_sum{self._label_str(values)} {_format(child.sum)}"
+            yield f"{self.name}_count{self._label_str(values)} {child.count}"
+
+
+requests_in_flight = Gauge("embedit_requests_in_flight", "Embed requests currently being handled.")
+request_duration = Histogram(
+    "embedit_request_duration_seconds",
+    "How long embed requests took, by provider and where the page came from.",
+    ("provider", "cache"),
+)
+cache_lookups = Counter(
+    "embedit_cache_lookups_total",
+    "Cache lookups by result: memory, hit, stale, negative or miss.",
+    ("result",),
+)
+cache_hit_ratio = Gauge(
+    "embedit_cache_hit_ratio", "The share of cache lookups served locally, including stale and negative hits."
+)
+not_modified_responses = Counter(
+    "embedit_not_modified_responses_total",
+    "Conditional requests answered with a 304, by endpoint: embed or oembed.",
+    ("endpoint",),
+)
+inflight_fetches = Gauge("embedit_inflight_fetches", "Upstream fetches currently running, after coalescing.")
+upstream_duration = Histogram(
+    "embedit_upstream_duration_seconds",
+    "How long fetching and parsing a post from its provider took.",
+    ("provider",),
+)
+upstream_errors = Counter(
+    "embedit_upstream_errors_total",
+    "Failed fetches from a provider, by the status they failed with.",
+    ("provider", "status"),
+)
+upstream_breaker_state = Gauge(
+    "embedit_upstream_breaker_state",
+    "Each provider's circuit breaker: 0 when closed, 1 when half open and 2 when open.",
+    ("provider",),
+)
+upstream_limit = Gauge(
+    "embedit_upstream_concurrency_limit", "How many fetches each provider currently lets in flight.", ("provider",)
+)
+upstream_rejections = Counter(
+    "embedit_upstream_rejections_total",
+    "Fetches turned away without calling the provider, by reason: open or limit.",
+    ("provider", "reason"),
+)
+deadline_timeouts = Counter(
+    "embedit_deadline_timeouts_total",
+    "Stages of a request that ran out of time, by stage: request, short_link, api or extract.",
+    ("stage",),
+)
+client_disconnects = Counter(
+    "embedit_client_disconnects_total", "Requests cancelled because the client disconnected before the answer."
+)
+extractor_duration = Histogram("embedit_extractor_duration_seconds", "How long yt-dlp extraction took.")
+extractor_errors = Counter("embedit_extractor_errors_total", "Failed yt-dlp extractions, by reason.", ("reason",))
+writer_queue = Gauge("embedit_cache_writer_queue", "Cache entries waiting to be written.")
+client_connections = Gauge(
+    "embedit_http_client_connections",
+    "Connections to each upstream, by state: in_use or queued.",
+    ("upstream", "state"),
+)
+client_reused = Counter(
+    "embedit_http_client_reused_connections_total",
+    "Requests to each upstream that reused a kept alive connection.",
+    ("upstream",),
+)
+db_wait = Histogram(
+    "embedit_db_wait_seconds",
+    "How long it took to get a database connection, by path.",
+    ("path",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
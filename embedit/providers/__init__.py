@@ -4,16 +4,21 @@ import sys
 
 from .instagram import InstagramProvider as InstagramProvider
 from .provider import Provider as Provider
+from .provider import host_of as host_of
 from .tiktok import TikTokProvider as TikTokProvider
 from .twitter import TwitterProvider as TwitterProvider
 
 logger = logging.getLogger(__name__)
 
 PROVIDERS: list[Provider] = []
+PROVIDERS_BY_HOST: dict[str, Provider] = {}
 
 for name, obj in inspect.getmembers(sys.modules[__name__], inspect.isclass):
     if issubclass(obj, Provider) and name != "Provider":
         logger.info("found provider with name %s, adding to all providers.", obj.__name__)
-        PROVIDERS.append(obj())
+        provider = obj()
+        PROVIDERS.append(provider)
+        for host in provider.hosts:
+            PROVIDERS_BY_HOST[host] = provider
 
-del obj, inspect, logging, sys, logger
+del obj, provider, host, inspect, logging, sys, logger
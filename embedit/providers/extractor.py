@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Literal, TypedDict
+
+import yt_dlp
+from fastapi import HTTPException
+
+from ..config import CONFIG
+from ..fixtures import fixtures
+from ..metrics import extractor_duration, extractor_errors
+
+__all__ = ("ExtractedFormat", "ExtractedInfo", "ExtractorPool", "extractor")
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractedFormat(TypedDict, total=False):
+    url: str
+    ext: str
+    width: int
+    height: int
+
+
+class ExtractedInfo(TypedDict, total=False):
+    """The subset of :class:`embedit.YTDLOutput` that providers use."""
+
+    id: str
+    title: str
+    description: str
+    uploader: str
+    uploader_url: str
+    webpage_url: str
+    url: str
+    ext: str
+    width: int
+    height: int
+    thumbnail: str
+    formats: list[ExtractedFormat]
+
+
+_info_fields = tuple(key for key in ExtractedInfo.__annotations__ if key != "formats")
+_format_fields = tuple(ExtractedFormat.__annotations__)
+
+# Each worker thread (or process) keeps its own warmed up YoutubeDL around, as they aren't thread safe.
+_local = threading.local()
+
+
+def _youtube_dl() -> yt_dlp.YoutubeDL:
+    ytdl: yt_dlp.YoutubeDL | None = getattr(_local, "ytdl", None)
+    if ytdl is None:
+        ytdl = yt_dlp.YoutubeDL({"quiet": True, "no_warnings": True, "skip_download": True})
+        _local.ytdl = ytdl
+    return ytdl
+
+
+def _slim(res: dict[str, Any]) -> ExtractedInfo:
+    info: dict[str, Any] = {key: res[key] for key in _info_fields if key in res}
+    info["formats"] = [
+        {key: fmt[key] for key in _format_fields if key in fmt} for fmt in res.get("formats") or () if fmt.get("url")
+    ]
+    return info  # type: ignore - built from the keys of ExtractedInfo.
+
+
+def _extract(url: str) -> ExtractedInfo | None:
+    # This runs inside of the pool, so only the slimmed down info has to cross back to the event loop.
+    try:
+        res = _youtube_dl().extract_info(url, download=False)
+    except yt_dlp.DownloadError as exc:
+        # The original holds onto yt-dlp internals that can't be pickled back from a worker process.
+        raise yt_dlp.DownloadError(str(exc)) from None
+    if not res:
+        return None
+    return _slim(res)  # type: ignore - yt-dlp's info dicts are untyped.
+
+
+class ExtractorPool:
+    """A dedicated pool for running yt-dlp extraction off of the event loop.
+
+    In ``thread`` mode, extraction runs in a thread pool that isn't shared with anything else.
+    In ``process`` mode, it runs in a process pool, so CPU heavy extraction isn't bound by the GIL.
+    Either way, each worker reuses its own ``YoutubeDL`` between calls.
+    """
+
+    def __init__(self, *, mode: Literal["thread", "process"], workers: int, timeout: float) -> None:
+        self.mode = mode
+        self.workers = workers
+        self.timeout = timeout
+        self._executor: Executor | None = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            logger.info("starting yt-dlp extractor pool with %d %s workers.", self.workers, self.mode)
+            if self.mode == "process":
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="extractor")
+        return self._executor
+
+    async def extract(self, url: str) -> ExtractedInfo:
+        """Extracts the info for the given url.
+
+        Args:
+            url (str): The url.
+
+        Raises:
+            HTTPException: With a 404 if nothing could be extracted, or a 504 if extraction timed out.
+                In thread mode, the timed out extraction is left to finish in the background.
+
+        Returns:
+            ExtractedInfo: The extracted info.
+        """
+        if fixtures.mode == "replay":
+            return fixtures.load("yt-dlp", url)  # type: ignore - it was recorded from an ExtractedInfo.
+
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            res = await asyncio.wait_for(loop.run_in_executor(self.executor, _extract, url), self.timeout)
+        except TimeoutError:
+            extractor_errors.labels("timeout").inc()
+            logger.warning("timed out extracting %s with yt-dlp.", url)
+            raise HTTPException(504) from None
+        except yt_dlp.DownloadError:
+            extractor_errors.labels("download_error").inc()
+            raise
+        finally:
+            extractor_duration.observe(time.perf_counter() - start)
+
+        if not res:
+            extractor_errors.labels("empty").inc()
+            raise HTTPException(404)
+        if fixtures.mode == "record":
+            fixtures.save("yt-dlp", url, res)
+        return res
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+extractor = ExtractorPool(
+    mode=CONFIG["extractor"]["mode"],
+    workers=CONFIG["extractor"]["workers"],
+    timeout=CONFIG["extractor"]["timeout"],
+)
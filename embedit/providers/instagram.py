@@ -8,16 +8,15 @@ from .provider import Provider
 
 if TYPE_CHECKING:
     from embedit import OpenGraphBaseData
+    from embedit.deadline import Deadline
 
 
 class InstagramProvider(Provider):
     name = "Instagram"
+    hosts = ("instagram.com",)
 
-    def match_url(self, url: str) -> bool:
-        return url.startswith("https://www.instagram")
-
-    async def parse(self, url: str) -> OpenGraphBaseData:
-        # data: YTDLOutput = await self._extract_info(url)
+    async def parse(self, url: str, deadline: Deadline) -> OpenGraphBaseData:
+        # data = await self._extract_info(url, deadline)
         # TODO: Fix this whenever yt-dlp fixes instagram downloads.
 
         raise HTTPException(400)
@@ -1,33 +1,67 @@
 from __future__ import annotations
 
 import abc
-import asyncio
 from typing import TYPE_CHECKING, ClassVar
+from urllib.parse import urlsplit
 
-import yt_dlp
-from fastapi import HTTPException
+from .extractor import extractor
 
 if TYPE_CHECKING:
-    from embedit import OpenGraphBaseData, YTDLOutput
+    from embedit import OpenGraphBaseData
+    from embedit.db import Database
+    from embedit.deadline import Deadline
 
-__all__ = ("Provider",)
+    from .extractor import ExtractedInfo
+
+__all__ = ("Provider", "host_of")
+
+
+def host_of(url: str) -> str | None:
+    """Gets the lowercased hostname of the url, without any ``www.`` prefix.
+
+    Args:
+        url (str): The url, with or without a scheme.
+
+    Returns:
+        str | None: The hostname, if the url has one.
+    """
+    if "://" not in url:
+        url = "//" + url
+    host = urlsplit(url).hostname
+    if host and host.startswith("www."):
+        host = host[4:]
+    return host
 
 
 class Provider(abc.ABC):
     name: ClassVar[str]
     color: ClassVar[str | None]
+    hosts: ClassVar[tuple[str, ...]]
+    """The hostnames, without ``www.``, that this provider handles. These are used to dispatch urls to providers."""
+    guarded: ClassVar[bool] = True
+    """Whether each fetch is made through the provider's :class:`embedit.resilience.UpstreamGuard`.
+    Providers that combine fetches into fewer upstream requests turn this off and guard those
+    requests themselves, so one failed request isn't counted once for every fetch in it.
+    """
+
+    async def start(self, db: Database) -> None:  # noqa: B027
+        """Called once when the app starts, before any requests are handled. Providers that
+        hold onto sessions or background tasks should set them up here.
 
-    async def _extract_info(self, url: str) -> YTDLOutput:
-        """Uses ytdlp to extract the given url. This is wrapped in to_thread
-        to make it async and if it does not return anything, it raises a 404.
+        Args:
+            db (Database): The app's database, for providers that store their own data.
         """
-        with yt_dlp.YoutubeDL() as ytdl:
-            res = await asyncio.to_thread(ytdl.extract_info, url, download=False)
-            if not res:
-                raise HTTPException(404)
-            return res  # type: ignore - due to circular imports i cannot cast
 
-    @abc.abstractmethod
+    async def close(self) -> None:  # noqa: B027
+        """Called once when the app shuts down, to clean up anything made in :meth:`start`."""
+
+    async def _extract_info(self, url: str, deadline: Deadline) -> ExtractedInfo:
+        """Uses ytdlp to extract the given url. This runs on the dedicated extractor pool
+        as the ``extract`` stage of the deadline, and if it does not return anything, it raises a 404.
+        """
+        async with deadline.stage("extract"):
+            return await extractor.extract(url)
+
     def match_url(self, url: str) -> bool:
         """Matches whether the given url is for this provider.
 
@@ -37,15 +71,34 @@ class Provider(abc.ABC):
         Returns:
             bool: Whether or not the given url matches this provider.
         """
-        ...
+        return host_of(url) in self.hosts
+
+    def canonicalize(self, url: str) -> str:
+        """Turns the url into the key it is cached under, so that every url for the same
+        post shares one cache entry. Providers should override this to key on the post's ID.
+
+        By default, this drops the query, fragment, ``www.`` prefix and trailing slash.
+
+        Args:
+            url (str): The url.
+
+        Returns:
+            str: The cache key.
+        """
+        parts = urlsplit(url if "://" in url else "https://" + url)
+        return f"https://{host_of(url)}{parts.path.rstrip('/')}"
 
     @abc.abstractmethod
-    async def parse(self, url: str) -> OpenGraphBaseData:
+    async def parse(self, url: str, deadline: Deadline) -> OpenGraphBaseData:
         """Parses the page and generates the opengraph metadata for embedding. This should
         throw a :class:`fastapi.HttpException` if an error occurs.
 
+        Every upstream call should be made as a :meth:`Deadline.stage`, so it is cancelled
+        once the request has run out of time.
+
         Args:
             url (str): The url to parse.
+            deadline (Deadline): The time budget of the request.
 
         Returns:
             OpenGraphData: The open graph object representing the data parsed.
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import math
+from collections import deque
+
+__all__ = ("InstallId", "InstallIdPool")
+
+# How much each new result moves the moving averages.
+_alpha = 0.2
+
+
+class InstallId:
+    """Tracks how healthy a single app install ID is, using moving averages of
+    its success rate and latency.
+    """
+
+    __slots__ = ("iid", "latency", "success_rate")
+
+    def __init__(self, iid: str, *, latency: float) -> None:
+        self.iid = iid
+        self.success_rate = 1.0
+        self.latency = latency
+
+    @property
+    def score(self) -> float:
+        """float: Higher is healthier. IDs that keep failing sink to the bottom, but recover once they succeed again."""
+        return self.success_rate / max(self.latency, 0.001)
+
+    def succeeded(self, latency: float) -> None:
+        self.success_rate += _alpha * (1 - self.success_rate)
+        self.latency += _alpha * (latency - self.latency)
+
+    def failed(self) -> None:
+        self.success_rate -= _alpha * self.success_rate
+
+    def outpaced(self, elapsed: float) -> None:
+        # Another ID answered first, so the real latency is unknown but at least ``elapsed``.
+        self.latency += _alpha * max(elapsed - self.latency, 0)
+
+
+class InstallIdPool:
+    """The app install IDs requests can be made with, ranked by health.
+
+    Args:
+        iids (list[str]): The install IDs.
+        hedge_percentile (float): The percentile of recent latencies to wait for before hedging.
+        hedge_min_delay (float): The shortest, in seconds, to wait before hedging.
+        hedge_initial_delay (float): How long, in seconds, to wait before hedging until enough latencies are known.
+    """
+
+    def __init__(
+        self, iids: list[str], *, hedge_percentile: float, hedge_min_delay: float, hedge_initial_delay: float
+    ) -> None:
+        self.ids = [InstallId(iid, latency=hedge_initial_delay) for iid in iids]
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_initial_delay = hedge_initial_delay
+        self._latencies: deque[float] = deque(maxlen=100)
+
+    def ranked(self) -> list[InstallId]:
+        """Gets the install IDs, healthiest first."""
+        return sorted(self.ids, key=lambda iid: iid.score, reverse=True)
+
+    def record(self, iid: InstallId, latency: float | None) -> None:
+        """Records the result of a request, ``latency`` is ``None`` if it failed."""
+        if latency is None:
+            iid.failed()
+            return
+        iid.succeeded(latency)
+        self._latencies.append(latency)
+
+    def cancelled(self, iid: InstallId, elapsed: float) -> None:
+        """Records a request that was cancelled after ``elapsed`` seconds because a hedged request won."""
+        iid.outpaced(elapsed)
+
+    def hedge_delay(self) -> float:
+        """Gets how long, in seconds, to wait on a request before also trying the next install ID."""
+        if len(self._latencies) < 10:
+            return self.hedge_initial_delay
+        latencies = sorted(self._latencies)
+        index = min(math.ceil(self.hedge_percentile * len(latencies)) - 1, len(latencies) - 1)
+        return max(latencies[max(index, 0)], self.hedge_min_delay)
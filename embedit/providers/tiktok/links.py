@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import logging
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+from ...config import CONFIG
+from ...writer import cache_writer
+from ..provider import host_of
+from .utils import get_id
+
+if TYPE_CHECKING:
+    from ...db import Database
+
+__all__ = ("ShortLinks", "short_links")
+
+logger = logging.getLogger(__name__)
+
+_INSERT = "INSERT OR IGNORE INTO short_links(url, aweme_id) VALUES(?, ?)"
+
+
+class ShortLinks:
+    """Resolves TikTok short links into video IDs, remembering every link it has resolved.
+
+    A short link always points at the same video, so resolved links are stored in the
+    ``short_links`` table forever, with an in-memory LRU of the most recent ones in front of it.
+    Only links that were never seen before go over the network.
+    """
+
+    def __init__(self, *, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._db: Database | None = None
+        self._ids: OrderedDict[str, str] = OrderedDict()
+
+    def bind(self, db: Database) -> None:
+        """Sets the database resolved links are stored in. Until this is called, they are only kept in memory."""
+        self._db = db
+
+    async def resolve(self, url: str) -> str | None:
+        """Gets the video ID the short link redirects to.
+
+        Args:
+            url (str): The short link.
+
+        Returns:
+            str | None: The video ID, if the link leads to one.
+        """
+        key = _key(url)
+        if (aweme_id := self._ids.get(key)) is not None:
+            self._ids.move_to_end(key)
+            return aweme_id
+
+        if self._db is not None:
+            async with self._db.read() as conn, conn.cursor() as cursor:
+                res = await cursor.execute("SELECT aweme_id FROM short_links WHERE url = ?", key)
+                row = await res.fetchone()
+            if row:
+                self._remember(key, row["aweme_id"])
+                return row["aweme_id"]
+
+        aweme_id = await get_id(url)
+        if aweme_id is None:
+            return None
+
+        logger.debug("resolved tiktok short link %s to %s.", key, aweme_id)
+        self._remember(key, aweme_id)
+        if self._db is not None:
+            # Stored in the background, it is remembered in memory until then.
+            cache_writer.submit_row(_INSERT, key, (key, aweme_id))
+        return aweme_id
+
+    def _remember(self, key: str, aweme_id: str) -> None:
+        self._ids[key] = aweme_id
+        self._ids.move_to_end(key)
+        while len(self._ids) > self.max_entries:
+            self._ids.popitem(last=False)
+
+
+def _key(url: str) -> str:
+    # Only the host and path decide where a short link leads.
+    parts = urlsplit(url if "://" in url else "https://" + url)
+    return f"{host_of(url)}{parts.path.rstrip('/')}"
+
+
+short_links = ShortLinks(max_entries=CONFIG["tiktok"]["short_link_cache_size"])
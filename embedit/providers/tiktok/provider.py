@@ -7,32 +7,44 @@ from fastapi import HTTPException
 
 if TYPE_CHECKING:
     from embedit import OpenGraphBaseData
+    from embedit.db import Database
+    from embedit.deadline import Deadline
 
 from ..provider import Provider
-from .utils import api_request, get_id, video_id_regex
+from .links import short_links
+from .utils import api_request, video_id_regex
 
 
 class TikTokProvider(Provider):
     name = "TikTok"
     color = "#ff0050"
+    hosts = ("tiktok.com", "m.tiktok.com", "vm.tiktok.com", "vt.tiktok.com")
 
-    def match_url(self, url: str) -> bool:
-        # TODO: Do this
-        return url.startswith("https://www.tiktok")
+    async def start(self, db: Database) -> None:
+        short_links.bind(db)
 
-    async def parse(self, url: str) -> OpenGraphBaseData:
+    def canonicalize(self, url: str) -> str:
+        if match := video_id_regex.match(url):
+            return f"tiktok:{match.group('id')}"
+        # Short links are always keyed on their url. Keying the ones we happen to have resolved in
+        # memory on their video would change their key after a restart, orphaning their cache entries.
+        return super().canonicalize(url)
+
+    async def parse(self, url: str, deadline: Deadline) -> OpenGraphBaseData:
         # TODO: Figure out if i can fix the circular imports.
         from embedit import OpenGraphVideoData
 
         if match := video_id_regex.match(url):
             video_id = match.group("id")
         else:
-            video_id = await get_id(url)
+            async with deadline.stage("short_link"):
+                video_id = await short_links.resolve(url)
 
         if not video_id:
             raise HTTPException(404)
 
-        data = await api_request(video_id)
+        async with deadline.stage("api"):
+            data = await api_request(video_id)
         aweme = data["aweme_list"][0]
         description: str = aweme["desc"]
         author_at: str = f"@{aweme['author']['unique_id']}"
@@ -3,10 +3,13 @@
 
 from __future__ import annotations
 
+import asyncio
 import datetime
+import logging
 import math
 import random
 import re
+import time
 import uuid
 from typing import TYPE_CHECKING
 
@@ -14,58 +17,141 @@ import aiohttp
 import yarl
 from fastapi import HTTPException
 
+from ...clients import clients
+from ...config import CONFIG
+from .health import InstallId, InstallIdPool
+
 if TYPE_CHECKING:
     from typing import Any
 
-__all__: tuple[str, ...] = ("get_id", "api_request", "video_id_regex")
+__all__: tuple[str, ...] = ("api_request", "get_id", "install_ids", "video_id_regex")
+
+logger = logging.getLogger(__name__)
 
 
-# Turns https://tiktok.com/<whatever> into a video ID.
 async def get_id(url: str) -> str | None:
-    async with session.get(url) as res:
-        if match := video_id_regex.match(str(res.url)):
+    """Resolves a short link like ``vm.tiktok.com/...`` into a video ID.
+
+    This follows the redirects one at a time and stops as soon as a ``Location`` points at a video,
+    so none of the pages along the way are downloaded.
+
+    Raises:
+        HTTPException: With a 502 if TikTok couldn't be reached or answered with an error, so that
+            an outage isn't mistaken for a link that leads nowhere.
+
+    Returns:
+        str | None: The video ID, or ``None`` if the redirects end somewhere that isn't a video.
+    """
+    if "://" not in url:
+        url = "https://" + url
+    for _ in range(max_redirects):
+        if match := video_id_regex.match(url):
             return match.group("id")
 
+        try:
+            async with clients.get("tiktok").get(url, allow_redirects=False) as res:
+                status = res.status
+                location = res.headers.get("Location")
+                next_url = res.url
+        except (aiohttp.ClientError, TimeoutError) as exc:
+            logger.warning("failed to resolve tiktok short link %s: %s", url, exc)
+            raise HTTPException(502, detail="couldn't reach tiktok to resolve the short link.") from exc
+
+        if status >= 500 or status == 429:
+            raise HTTPException(502, detail=f"tiktok returned status {status} resolving the short link.")
+        if status not in redirect_statuses or not location:
+            return None
+        url = str(next_url.join(yarl.URL(location)))
+
+    logger.warning("gave up resolving a tiktok short link after %d redirects.", max_redirects)
     return None
 
 
 async def api_request(vid_id: str) -> dict[str, Any]:
-    for ids in app_install_ids:
-        dynamic_query: dict[str, Any] = {
-            "aweme_id": vid_id,
-            "iid": ids,
-            "last_install_time": math.floor(datetime.datetime.now().timestamp() // 1000)
-            - random.randint(86400, 1123200),
-            "aid": str(app_id),
-            "app_name": app_name,
-            "version_code": "".join(i.rjust(2, "0") for i in app_version.split(".")),  # x.y.z => x.0y.0z
-            "version_name": app_version,
-            "manifest_version_code": app_manifest_version,
-            "update_version_code": app_manifest_version,
-            "ab_version": app_version,
-            "build_number": app_version,
-            "_rticket": str(math.floor(datetime.datetime.now().timestamp())),
-            "cdid": str(uuid.uuid4()),
-            # Random 16 length hex, slice off ``0x``
-            "opeuid": "".join(hex(random.randint(0x1000000000000000, 0x1111111111111111)))[2:],
-            "ts": str(math.floor(datetime.datetime.now().timestamp() / 1000)),
-            "device_id": str(random.randint(7250000000000000000, 7351147085025500000)),
-            "device_type": "Pixel 7",
-            "device_brand": "Google",
-            "device_platform": "android",
-        }
-        query = base_query | dynamic_query
-
-        async with session.get(
-            base_url.with_query(query),
-        ) as res:
-            if res.headers.get("Content-Length") == "0":
+    """Fetches the video from TikTok's api, trying the healthiest install ID first.
+
+    If it hasn't answered within the hedge delay, the next healthiest ID is tried alongside it,
+    and whichever answers first wins. Failed attempts move straight on to the next ID.
+    """
+    remaining = iter(install_ids.ranked())
+    pending: set[asyncio.Task[dict[str, Any] | None]] = set()
+
+    def attempt_next() -> bool:
+        iid = next(remaining, None)
+        if iid is None:
+            return False
+        pending.add(asyncio.create_task(_attempt(iid, vid_id)))
+        return True
+
+    exhausted = not attempt_next()
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=None if exhausted else install_ids.hedge_delay(),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                logger.debug("tiktok request for %s is slow, hedging with the next install id.", vid_id)
+                exhausted = not attempt_next()
                 continue
-            return await res.json()
+
+            for task in done:
+                if (data := task.result()) is not None:
+                    return data
+                if not exhausted:
+                    exhausted = not attempt_next()
+    finally:
+        for task in pending:
+            task.cancel()
 
     raise HTTPException(500, "There was an error fetching tiktok.")
 
 
+async def _attempt(iid: InstallId, vid_id: str) -> dict[str, Any] | None:
+    dynamic_query: dict[str, Any] = {
+        "aweme_id": vid_id,
+        "iid": iid.iid,
+        "last_install_time": math.floor(datetime.datetime.now().timestamp() // 1000) - random.randint(86400, 1123200),
+        "aid": str(app_id),
+        "app_name": app_name,
+        "version_code": "".join(i.rjust(2, "0") for i in app_version.split(".")),  # x.y.z => x.0y.0z
+        "version_name": app_version,
+        "manifest_version_code": app_manifest_version,
+        "update_version_code": app_manifest_version,
+        "ab_version": app_version,
+        "build_number": app_version,
+        "_rticket": str(math.floor(datetime.datetime.now().timestamp())),
+        "cdid": str(uuid.uuid4()),
+        # Random 16 length hex, slice off ``0x``
+        "opeuid": "".join(hex(random.randint(0x1000000000000000, 0x1111111111111111)))[2:],
+        "ts": str(math.floor(datetime.datetime.now().timestamp() / 1000)),
+        "device_id": str(random.randint(7250000000000000000, 7351147085025500000)),
+        "device_type": "Pixel 7",
+        "device_brand": "Google",
+        "device_platform": "android",
+    }
+    query = base_query | dynamic_query
+
+    start = time.perf_counter()
+    try:
+        async with clients.get("tiktok").get(base_url.with_query(query)) as res:
+            if res.headers.get("Content-Length") == "0":
+                install_ids.record(iid, None)
+                return None
+            data = await res.json()
+    except asyncio.CancelledError:
+        install_ids.cancelled(iid, time.perf_counter() - start)
+        raise
+    except (aiohttp.ClientError, TimeoutError, ValueError) as exc:
+        logger.warning("tiktok request with install id %s failed: %s", iid.iid, exc)
+        install_ids.record(iid, None)
+        return None
+
+    install_ids.record(iid, time.perf_counter() - start)
+    return data
+
+
 # This is a dictionary of basic query params that do not change.
 base_query: dict[str, Any] = {
     "ssmix": "a",
@@ -98,11 +184,15 @@ app_id = 0
 app_version = "34.1.2"
 app_manifest_version = "2023401020"
 user_agent = f"com.zhiliaoapp.musically/${app_version} (Linux; U; Android 13; en_US; Pixel 7; Build/TD1A.220804.031; Cronet/58.0.2991.0)"  # noqa: E501
-app_install_ids = [
-    "7351144126450059040",
-    "7351149742343391009",
-    "7351153174894626592",
-]
-base_url = yarl.URL("https://api22-normal-c-useast2a.tiktokv.com/aweme/v1/feed/")
-session = aiohttp.ClientSession(headers={"User-Agent": user_agent})
-video_id_regex = re.compile(r"https?://(www)?.tiktok.com/@[A-Za-z_]+/(video|photo)/(?P<id>\d+)")
+install_ids = InstallIdPool(
+    CONFIG["tiktok"]["app_install_ids"],
+    hedge_percentile=CONFIG["tiktok"]["hedge_percentile"],
+    hedge_min_delay=CONFIG["tiktok"]["hedge_min_delay"],
+    hedge_initial_delay=CONFIG["tiktok"]["hedge_initial_delay"],
+)
+base_url = yarl.URL(CONFIG["tiktok"]["api_url"])
+# Everything but the video's ID is made up for each request, so only it identifies a fixture.
+clients.register("tiktok", headers={"User-Agent": user_agent}, fixture_params=("aweme_id",))
+redirect_statuses = frozenset((301, 302, 303, 307, 308))
+max_redirects = 5
+video_id_regex = re.compile(r"(https?://)?(www\.|m\.)?tiktok\.com/@[\w.-]+/(video|photo)/(?P<id>\d+)")
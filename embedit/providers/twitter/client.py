@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Any
+
+import aiohttp
+from fastapi import HTTPException
+from twitter.constants import Operation
+
+from ...clients import clients
+from ...config import CONFIG
+from ...resilience import UpstreamUnavailable, guards
+
+__all__ = ("GuestSession", "TweetBatcher", "TwitterClient", "batcher", "client")
+
+logger = logging.getLogger(__name__)
+
+# The bearer token used by twitter's own web app.
+bearer_token = (
+    "Bearer AAAAAAAAAAAAAAAAAAAAANRILgAAAAAAnNwIzUejRCOuH5E6I8xnZz4puTs=1Zv7ttfk8LF81IUq16cHjhLTvJu4FA33AGWWjCpTnA"  # noqa: S105
+)
+user_agent = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36"
+)
+activate_url = f"{CONFIG['twitter']['api_url']}/1.1/guest/activate.json"
+graphql_url = CONFIG["twitter"]["graphql_url"]
+
+clients.register(
+    "twitter",
+    headers={
+        "authorization": bearer_token,
+        "user-agent": user_agent,
+        "content-type": "application/json",
+        "x-twitter-active-user": "yes",
+        "x-twitter-client-language": "en",
+    },
+)
+
+# How long, in seconds, until activating guest sessions is retried after it failed. This doubles
+# with every failure in a row, up to ``_max_retry_delay``.
+_retry_delay = 30
+_max_retry_delay = 300
+
+# The features never change, so only serialize them once.
+_features = json.dumps(Operation.default_features, separators=(",", ":"))
+
+
+@dataclass
+class GuestSession:
+    token: str
+    created: float
+    revoked: bool = False
+    """Whether twitter rejected this session, so it should be renewed as soon as possible."""
+
+    def due(self, lifetime: float) -> float:
+        """Gets the monotonic time this session should be renewed at."""
+        return self.created + lifetime
+
+
+class TwitterClient:
+    """An async client for twitter's graphql api, using guest sessions.
+
+    Twitter invalidates guest sessions after 3h, so sessions are renewed in the background
+    before they expire (or as soon as twitter rejects one). Requests are rotated between
+    several sessions to spread the load, and never create a session themselves.
+    """
+
+    def __init__(self, *, sessions: int, lifetime: float, wait: float) -> None:
+        self.size = sessions
+        self.lifetime = lifetime
+        self.wait = wait
+        self._sessions: list[GuestSession] = []
+        self._next = 0
+        self._renewer: asyncio.Task[None] | None = None
+        self._ready = asyncio.Event()
+        self._wake = asyncio.Event()
+        self._failures = 0
+        """How many times in a row activating a session failed."""
+        self._retry_at: float | None = None
+        """The monotonic time activating sessions is retried at, if it failed."""
+
+    @property
+    def http(self) -> aiohttp.ClientSession:
+        return clients.get("twitter")
+
+    async def start(self) -> None:
+        self._renewer = asyncio.create_task(self._renew_forever())
+
+    async def close(self) -> None:
+        if self._renewer is not None:
+            self._renewer.cancel()
+            self._renewer = None
+
+    async def tweets(self, tweet_ids: list[int]) -> dict[int, dict[str, Any]]:
+        """Looks up several tweets in one request.
+
+        The request is made through the ``Twitter`` :class:`embedit.resilience.UpstreamGuard`, so
+        a failed batch counts as one failure however many tweets were in it.
+
+        Args:
+            tweet_ids (list[int]): The tweets' IDs.
+
+        Raises:
+            HTTPException: With a 503 if twitter rejected the session or rate limited us,
+                or a 502 if twitter returned an error.
+            UpstreamUnavailable: If the guard isn't letting requests through to twitter.
+
+        Returns:
+            dict[int, dict[str, Any]]: Each tweet's ``tweetResult``, by its ID. Tweets that don't exist
+                are left out.
+        """
+        session = await self._session()
+        _, query_id, name = Operation.TweetResultsByRestIds
+        params = {
+            "variables": json.dumps(
+                Operation.default_variables | {"tweetIds": [str(tweet_id) for tweet_id in tweet_ids]},
+                separators=(",", ":"),
+            ),
+            "features": _features,
+        }
+        async with (
+            guards.get("Twitter").call(),
+            self.http.get(
+                f"{graphql_url}/{query_id}/{name}", params=params, headers={"x-guest-token": session.token}
+            ) as res,
+        ):
+            if res.status in (401, 403, 429):
+                logger.warning("twitter rejected a guest session with status %d, renewing it.", res.status)
+                session.revoked = True
+                self._wake.set()
+                raise HTTPException(503)
+            if res.status >= 400:
+                raise HTTPException(502, detail=f"twitter returned status {res.status}.")
+            data = await res.json()
+
+        results: dict[int, dict[str, Any]] = {}
+        for tweet_result in data["data"]["tweetResult"]:
+            result = tweet_result.get("result", {})
+            # Tweets with limited visibility are wrapped one level deeper.
+            result = result.get("tweet", result)
+            if rest_id := result.get("rest_id"):
+                results[int(rest_id)] = {"result": result}
+        return results
+
+    async def _session(self) -> GuestSession:
+        # This only waits if a request comes in before the first session was activated.
+        try:
+            async with asyncio.timeout(self.wait):
+                await self._ready.wait()
+        except TimeoutError:
+            raise HTTPException(
+                503, detail="no twitter guest session is ready.", headers={"Retry-After": str(self._retry_after())}
+            ) from None
+        usable = [session for session in self._sessions if not session.revoked] or self._sessions
+        self._next = (self._next + 1) % len(usable)
+        return usable[self._next]
+
+    async def _activate(self) -> GuestSession:
+        async with self.http.post(activate_url) as res:
+            res.raise_for_status()
+            data = await res.json()
+        return GuestSession(token=data["guest_token"], created=time.monotonic())
+
+    def _retry_after(self) -> int:
+        if self._retry_at is None:
+            return _retry_delay
+        return max(1, round(self._retry_at - time.monotonic()))
+
+    async def _renew_forever(self) -> None:
+        while True:
+            now = time.monotonic()
+            failed = False
+            for index in range(self.size):
+                session = self._sessions[index] if index < len(self._sessions) else None
+                if session is not None and not session.revoked and session.due(self.lifetime) > now:
+                    continue
+
+                try:
+                    new = await self._activate()
+                except Exception:
+                    logger.exception("failed to activate a twitter guest session.")
+                    # The rest would most likely fail the same way, so leave them for the retry.
+                    failed = True
+                    break
+
+                logger.info("activated twitter guest session %d.", index)
+                if session is None:
+                    self._sessions.append(new)
+                else:
+                    self._sessions[index] = new
+
+            if self._sessions:
+                self._ready.set()
+
+            # Sleep until the next working session is due, retrying sooner, with backoff, if activating one failed.
+            now = time.monotonic()
+            delay = min(
+                (
+                    session.due(self.lifetime) - now
+                    for session in self._sessions
+                    if not session.revoked and session.due(self.lifetime) > now
+                ),
+                default=_max_retry_delay,
+            )
+            if failed:
+                self._failures += 1
+                delay = min(delay, _retry_delay * 2 ** (self._failures - 1), _max_retry_delay)
+                self._retry_at = now + delay
+            else:
+                self._failures = 0
+                self._retry_at = None
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), timeout=max(delay, 1))
+            self._wake.clear()
+
+
+client = TwitterClient(
+    sessions=CONFIG["twitter"]["sessions"],
+    lifetime=CONFIG["twitter"]["session_lifetime"],
+    wait=CONFIG["twitter"]["session_wait"],
+)
+
+
+class TweetBatcher:
+    """Collects tweet lookups for a short window and resolves them in one request.
+
+    A batch is sent once ``window`` seconds have passed since its first lookup, or as soon
+    as it has ``max_size`` tweets. Every lookup gets its own tweet back, so one missing
+    tweet doesn't fail the others in its batch.
+    """
+
+    def __init__(self, client: TwitterClient, *, window: float, max_size: int) -> None:
+        self.client = client
+        self.window = window
+        self.max_size = max_size
+        self._pending: dict[int, list[asyncio.Future[dict[str, Any]]]] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        self._batches: set[asyncio.Task[None]] = set()
+
+    async def tweet(self, tweet_id: int) -> dict[str, Any]:
+        """Looks up a tweet in the next batch.
+
+        Args:
+            tweet_id (int): The tweet's ID.
+
+        Returns:
+            dict[str, Any]: The tweet's ``tweetResult``, which is empty if it doesn't exist.
+        """
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[dict[str, Any]] = loop.create_future()
+        self._pending.setdefault(tweet_id, []).append(future)
+
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, {}
+        task = asyncio.create_task(self._resolve(batch))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def close(self) -> None:
+        """Cancels every batch, along with the lookups waiting on them."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        for futures in batch.values():
+            for future in futures:
+                future.cancel()
+        for task in self._batches:
+            task.cancel()
+        await asyncio.gather(*self._batches, return_exceptions=True)
+
+    async def _resolve(self, batch: dict[int, list[asyncio.Future[dict[str, Any]]]]) -> None:
+        logger.debug("looking up a batch of %d tweets.", len(batch))
+        try:
+            results = await self.client.tweets(list(batch))
+        except Exception as exc:
+            for future in _unresolved(batch):
+                future.set_exception(_batch_failed(exc))
+            return
+        except BaseException:
+            # The batch was cancelled, like at shutdown, so its lookups are too instead of waiting forever.
+            for future in _unresolved(batch):
+                future.cancel()
+            raise
+
+        for tweet_id, futures in batch.items():
+            result = results.get(tweet_id, {})
+            for future in futures:
+                if not future.done():
+                    future.set_result(result)
+
+
+def _unresolved(batch: dict[int, list[asyncio.Future[dict[str, Any]]]]) -> Iterator[asyncio.Future[dict[str, Any]]]:
+    for futures in batch.values():
+        yield from (future for future in futures if not future.done())
+
+
+def _batch_failed(exc: Exception) -> HTTPException:
+    # Each lookup gets an exception of its own, caused by the batch's, so they don't share a traceback.
+    if isinstance(exc, UpstreamUnavailable):
+        # Kept as is, so the cache knows the guard turned it away and doesn't remember it.
+        failure = UpstreamUnavailable(exc.upstream, exc.reason, exc.retry_after)
+    elif isinstance(exc, HTTPException):
+        failure = HTTPException(exc.status_code, detail=exc.detail, headers=exc.headers)
+    else:
+        failure = HTTPException(502, detail="looking up a batch of tweets failed.")
+    failure.__cause__ = exc
+    return failure
+
+
+batcher = TweetBatcher(
+    client,
+    window=CONFIG["twitter"]["batch_window"],
+    max_size=CONFIG["twitter"]["batch_size"],
+)
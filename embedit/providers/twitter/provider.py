@@ -1,83 +1,66 @@
 from __future__ import annotations
 
-import asyncio
 import html
 import logging
 import re
-from datetime import datetime, timedelta
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING
 
 from fastapi import HTTPException
-from twitter.scraper import Scraper
-from twitter.util import init_session
 
-from .provider import Provider
+from ..provider import Provider
+from .client import batcher, client
 
 if TYPE_CHECKING:
     from embedit import OpenGraphBaseData
+    from embedit.db import Database
+    from embedit.deadline import Deadline
 
 logger = logging.getLogger(__name__)
 
 
 # Twitter is a complicated beast.
 # Specifically, we have to do a lot of graphql, and yt-dlp can only fetch videos.
-class ScraperWrapper:
-    """A wrapper for the twitter scraper that invalidates the scraper every 2.5h
-    as twitter invalidates guest sessions after 3h. This also wraps some methods for
-    convenience as methods here need to be wrapped in to_thread
-    """
-
-    _scraper: Scraper
-    _created: datetime
-
-    def __init__(self) -> None:
-        self._scraper = Scraper(session=init_session(), save=False)
-        self._created = datetime.now()
-
-    @property
-    def scraper(self) -> Scraper:
-        now = datetime.now()
-        if self._created + timedelta(hours=2.5) < now:
-            # Create new scraper
-            logger.info("old scraper expired, creating a new one.")
-            self._scraper = Scraper(session=init_session(), save=False)
-        return self._scraper
-
-    async def tweets(self, tweet: int) -> list[dict[Any, Any]]:
-        return await asyncio.to_thread(self.scraper.tweets_by_id, [tweet])
-
-
-scraper = ScraperWrapper()
-
-regex = re.compile(r"https?:\/\/(x|twitter)\.com\/[A-Za-z0-9_]+\/status\/(?P<id>\d+)")
+regex = re.compile(r"(https?:\/\/)?(www\.|mobile\.)?(x|twitter)\.com\/[A-Za-z0-9_]+\/status\/(?P<id>\d+)")
 size_regex = re.compile(r"(?P<width>\d+)x(?P<height>\d+)")
 
 
 class TwitterProvider(Provider):
     name = "Twitter"
     color = "#1DA1F2"
+    hosts = ("twitter.com", "x.com", "mobile.twitter.com", "mobile.x.com")
+    # Lookups are batched, so the client guards each batch's request instead.
+    guarded = False
+
+    async def start(self, db: Database) -> None:
+        await client.start()
+
+    async def close(self) -> None:
+        await batcher.close()
+        await client.close()
 
-    def match_url(self, url: str) -> bool:
-        return url.startswith("https://twitter") or url.startswith("https://x")
+    def canonicalize(self, url: str) -> str:
+        if match := regex.match(url):
+            return f"twitter:{match.group('id')}"
+        return super().canonicalize(url)
 
-    async def parse(self, url: str) -> OpenGraphBaseData:
+    async def parse(self, url: str, deadline: Deadline) -> OpenGraphBaseData:
         from embedit import OpenGraphImageData, OpenGraphTextData, OpenGraphVideoData
 
         match = regex.match(url)
         if not match:
             raise HTTPException(404)
         tweet_id: str = match.group("id")
-        data = await scraper.tweets(int(tweet_id))
+        async with deadline.stage("api"):
+            result = await batcher.tweet(int(tweet_id))
         # So, after parsing this a bit with jq, we get the following:
-        # .[0].data.tweetResult.result
+        # .data.tweetResult[].result
         # .legacy gives us access to the tweet's data, while .core.user_results.result.legacy
         # gives us the user data we want
         # .full_text seems to be what we want and
         # to get media we can then do .entities.media[0], then we can do ``media_url_https``
         # also applicable is ``type``
         # if it is just text, then ``media`` won't even exist.
-        # if it doesn't exist, then [0].data.tweetResult is just an empty dict.
-        result = data[0]["data"]["tweetResult"]
+        # if it doesn't exist, then the tweet's entry in .data.tweetResult is just an empty dict.
         if not result:
             raise HTTPException(404)
         result = result["result"]
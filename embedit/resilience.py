@@ -0,0 +1,312 @@
+"""Keeps one failing upstream from taking the rest of the app down with it.
+
+Every fetch from a provider goes through that provider's :class:`UpstreamGuard`, which combines:
+
+- A :class:`CircuitBreaker`, which stops calling the upstream for a while once it has failed
+  ``failure_threshold`` times in a row, and then lets a single probe through to see if it recovered.
+- An :class:`AdaptiveLimiter`, which caps how many fetches can be in flight at once. The cap grows
+  by about one for every ``limit`` fetches that succeed, and is cut by ``backoff`` whenever one fails
+  (AIMD, like TCP's congestion window), so a slowing upstream gets fewer requests piled onto it.
+  Fetches over the cap wait up to ``queue_timeout`` seconds for a slot, so bursts aren't turned away.
+
+Fetches the guard won't let through fail straight away with :class:`UpstreamUnavailable`, instead
+of waiting on the upstream. A fetch fails if the provider raises anything but an
+:class:`HTTPException` below 500, so a deleted post doesn't count against its upstream. A fetch
+that runs out of its request's :class:`embedit.deadline.Deadline` only fails if the upstream used
+up the whole limit of its stage. Otherwise the request was just short on time, and says nothing
+about the upstream.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Literal
+
+from fastapi import HTTPException
+
+from .config import CONFIG, ResilienceConfig
+from .deadline import DeadlineExceeded
+from .metrics import upstream_rejections
+
+__all__ = (
+    "AdaptiveLimiter",
+    "BreakerState",
+    "CircuitBreaker",
+    "GuardStats",
+    "UpstreamGuard",
+    "UpstreamGuards",
+    "UpstreamUnavailable",
+    "guards",
+    "resilience_config",
+)
+
+logger = logging.getLogger(__name__)
+
+BreakerState = Literal["closed", "open", "half_open"]
+
+
+class UpstreamUnavailable(HTTPException):
+    """Raised instead of fetching from an upstream that the guard isn't letting requests through to."""
+
+    def __init__(self, upstream: str, reason: Literal["open", "limit"], retry_after: float) -> None:
+        super().__init__(
+            503,
+            detail=f"{upstream} is unavailable right now.",
+            headers={"Retry-After": str(max(1, round(retry_after)))},
+        )
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops calls to an upstream after too many consecutive failures.
+
+    Args:
+        name (str): The upstream's name, for logging.
+        failure_threshold (int): How many failures in a row open the breaker.
+        reset_timeout (float): How long, in seconds, the breaker stays open before letting a probe through.
+    """
+
+    def __init__(self, name: str, *, failure_threshold: int, reset_timeout: float) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        """How many calls have failed in a row."""
+        self._opened: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> BreakerState:
+        if self._opened is None:
+            return "closed"
+        if time.monotonic() - self._opened < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def retry_after(self) -> float:
+        """Gets how long, in seconds, until the breaker lets a probe through."""
+        if self._opened is None:
+            return 0
+        return max(0, self._opened + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        """Gets whether a call may go through. While half open, only one call at a time is let through."""
+        match self.state:
+            case "closed":
+                return True
+            case "open":
+                return False
+            case "half_open":
+                if self._probing:
+                    return False
+                self._probing = True
+                return True
+
+    def record(self, ok: bool | None) -> None:
+        """Records how a call that was let through went, or ``None`` if it was cancelled before it could tell."""
+        self._probing = False
+        if ok is None:
+            return
+        if ok:
+            if self._opened is not None:
+                logger.info("closing the %s circuit breaker after a successful probe.", self.name)
+            self.failures = 0
+            self._opened = None
+            return
+
+        self.failures += 1
+        if self._opened is not None or self.failures >= self.failure_threshold:
+            if self._opened is None:
+                logger.warning("opening the %s circuit breaker after %d failures in a row.", self.name, self.failures)
+            self._opened = time.monotonic()
+
+
+class AdaptiveLimiter:
+    """Caps how many calls to an upstream can be in flight, adapting the cap with AIMD.
+
+    Args:
+        initial (int): The cap to start with.
+        min_limit (int): The cap is never cut below this.
+        max_limit (int): The cap never grows above this.
+        backoff (float): What the cap is multiplied by when a call fails.
+    """
+
+    def __init__(self, *, initial: int, min_limit: int, max_limit: int, backoff: float) -> None:
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future[None]] = deque()
+
+    @property
+    def queued(self) -> int:
+        """How many calls are waiting for a slot."""
+        return sum(not waiter.done() for waiter in self._waiters)
+
+    async def acquire(self, timeout: float) -> bool:
+        """Takes a slot for a call, waiting up to ``timeout`` seconds for one if the cap has been reached.
+
+        Returns:
+            bool: Whether a slot was taken.
+        """
+        if self.in_flight < int(self.limit) and not self.queued:
+            self.in_flight += 1
+            return True
+        if timeout <= 0:
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            async with asyncio.timeout(timeout):
+                await waiter
+        except BaseException as exc:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended, so pass it on.
+                self._give_back()
+            else:
+                waiter.cancel()
+            if isinstance(exc, TimeoutError):
+                return False
+            raise
+        return True
+
+    def release(self, ok: bool | None) -> None:
+        """Gives back a call's slot, adapting the cap to how it went (``None`` leaves the cap as is)."""
+        if ok:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        elif ok is not None:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+        self._give_back()
+
+    def _give_back(self) -> None:
+        self.in_flight -= 1
+        # Hand freed slots straight to the longest waiting calls.
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+
+@dataclass
+class GuardStats:
+    """The state of one upstream's guard."""
+
+    state: BreakerState
+    consecutive_failures: int
+    limit: float
+    """The current cap on calls in flight."""
+    in_flight: int
+    queued: int
+    """How many calls are waiting for a slot."""
+    retry_after: float
+    """How long, in seconds, until an open breaker lets a probe through."""
+
+
+class UpstreamGuard:
+    """The circuit breaker and concurrency limit for one upstream.
+
+    Args:
+        name (str): The upstream's name, which is the name of its provider.
+        config (ResilienceConfig): How the breaker and limiter behave.
+    """
+
+    def __init__(self, name: str, config: ResilienceConfig) -> None:
+        self.name = name
+        self.breaker = CircuitBreaker(
+            name, failure_threshold=config["failure_threshold"], reset_timeout=config["reset_timeout"]
+        )
+        self.limiter = AdaptiveLimiter(
+            initial=config["initial_limit"],
+            min_limit=config["min_limit"],
+            max_limit=config["max_limit"],
+            backoff=config["backoff"],
+        )
+        self.queue_timeout = config["queue_timeout"]
+
+    @property
+    def available(self) -> bool:
+        """Whether the breaker is letting calls through at all. The limiter may still turn them away."""
+        return self.breaker.state != "open"
+
+    @asynccontextmanager
+    async def call(self) -> AsyncIterator[None]:
+        """Guards a call to the upstream, recording how it went.
+
+        Raises:
+            UpstreamUnavailable: Before the call is made, if the breaker is open or no slot
+                freed up within the queue timeout.
+        """
+        if not self.available:
+            upstream_rejections.labels(self.name, "open").inc()
+            raise UpstreamUnavailable(self.name, "open", self.breaker.retry_after())
+        if not await self.limiter.acquire(self.queue_timeout):
+            upstream_rejections.labels(self.name, "limit").inc()
+            raise UpstreamUnavailable(self.name, "limit", 1)
+        if not self.breaker.allow():
+            self.limiter.release(None)
+            upstream_rejections.labels(self.name, "open").inc()
+            raise UpstreamUnavailable(self.name, "open", self.breaker.retry_after())
+
+        ok: bool | None = None
+        try:
+            yield
+            ok = True
+        except DeadlineExceeded as exc:
+            ok = False if exc.slow_upstream else None
+            raise
+        except HTTPException as exc:
+            ok = exc.status_code < 500
+            raise
+        except Exception:
+            ok = False
+            raise
+        finally:
+            self.limiter.release(ok)
+            self.breaker.record(ok)
+
+    def stats(self) -> GuardStats:
+        return GuardStats(
+            state=self.breaker.state,
+            consecutive_failures=self.breaker.failures,
+            limit=self.limiter.limit,
+            in_flight=self.limiter.in_flight,
+            queued=self.limiter.queued,
+            retry_after=self.breaker.retry_after(),
+        )
+
+
+def resilience_config(name: str) -> ResilienceConfig:
+    """Gets the config for the named upstream, which is the ``default`` config with its own overrides applied."""
+    config = CONFIG["resilience"]
+    return config["default"] | config.get(name, {})  # type: ignore - an override is a partial config.
+
+
+class UpstreamGuards:
+    """The guard of every upstream, created the first time each is used."""
+
+    def __init__(self) -> None:
+        self._guards: dict[str, UpstreamGuard] = {}
+
+    def get(self, name: str) -> UpstreamGuard:
+        guard = self._guards.get(name)
+        if guard is None:
+            guard = self._guards[name] = UpstreamGuard(name, resilience_config(name))
+        return guard
+
+    def stats(self) -> dict[str, GuardStats]:
+        """Gets the state of every upstream's guard, by name."""
+        return {name: guard.stats() for name, guard in self._guards.items()}
+
+
+guards = UpstreamGuards()
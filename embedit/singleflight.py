@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Generic, TypeVar
+
+__all__ = ("SingleFlight",)
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight(Generic[T]):
+    """Coalesces concurrent calls for the same key into a single call.
+
+    The first caller for a key starts the work, every caller that arrives while it
+    is still running waits on the same result and gets the same return value or
+    the same exception. Once the work finishes the key is forgotten, so the next
+    call starts fresh.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: dict[str, asyncio.Future[T]] = {}
+        self._waiters: dict[asyncio.Future[T], int] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._inflight
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        """Runs ``func`` for the given key, unless a call for that key is already running.
+
+        The shared call is shielded, so a waiter being cancelled (for example, the client
+        disconnecting) does not cancel the work for everyone else. Once every waiter has been
+        cancelled though, nobody is left to want the result, so the call is cancelled too.
+
+        Args:
+            key (str): The key to coalesce calls on.
+            func (Callable[[], Awaitable[T]]): The function to call if nothing is in flight for the key.
+
+        Returns:
+            T: The result of the shared call.
+        """
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._inflight[key] = future
+            future.add_done_callback(lambda fut: self._forget(key, fut))
+        else:
+            logger.debug("joining in-flight call for %s.", key)
+
+        self._waiters[future] = self._waiters.get(future, 0) + 1
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self._waiters[future] -= 1
+            if not self._waiters[future]:
+                del self._waiters[future]
+                if not future.done():
+                    logger.debug("every caller for %s is gone, cancelling it.", key)
+                    future.cancel()
+
+    def _forget(self, key: str, future: asyncio.Future[T]) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # If every waiter was cancelled, nobody is left to retrieve the exception.
+        if not future.cancelled():
+            future.exception()
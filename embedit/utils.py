@@ -1,8 +1,8 @@
-from .providers import PROVIDERS, Provider
+from .providers import PROVIDERS_BY_HOST, Provider, host_of
 
 
 def find_provider(url: str) -> Provider | None:
-    for provider in PROVIDERS:
-        if provider.match_url(url):
-            return provider
-    return None
+    host = host_of(url)
+    if host is None:
+        return None
+    return PROVIDERS_BY_HOST.get(host)
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from .config import CONFIG
+from .metadata import RENDER_VERSION
+
+if TYPE_CHECKING:
+    from .cache import CacheEntry
+    from .db import Database
+
+__all__ = ("UPSERT", "CacheWriter", "WriterStats", "cache_writer")
+
+logger = logging.getLogger(__name__)
+
+UPSERT = """
+INSERT INTO cache(url, data, expiry, type, html, render_version) VALUES(?, ?, ?, ?, ?, ?)
+ON CONFLICT(url) DO UPDATE SET
+    data = excluded.data,
+    expiry = excluded.expiry,
+    type = excluded.type,
+    html = excluded.html,
+    render_version = excluded.render_version
+"""
+"""Inserts a cache row, or replaces the one already there for the url."""
+
+
+@dataclass
+class WriterStats:
+    queued: int = 0
+    """How many entries and rows are waiting to be written."""
+    written: int = 0
+    """How many entries and rows have been written."""
+    batches: int = 0
+    """How many transactions entries have been written in."""
+    dropped: int = 0
+    """How many entries and rows were never written because the queue was full."""
+    failed: int = 0
+    """How many entries and rows were lost to a failed transaction."""
+    last_batch_seconds: float = 0
+    """How long the last transaction took."""
+
+
+class CacheWriter:
+    """Writes cache entries to sqlite in the background, so requests never wait on a write.
+
+    Entries are queued by their cache key, and a single writer task drains the queue in
+    transactions of up to ``batch_size`` entries. Queueing the same key again before it is
+    written only keeps the newest entry. Until an entry is written, :meth:`get` still returns
+    it, so a request that comes in meanwhile isn't a miss.
+
+    Other tables that are written to while answering a request, like ``failures`` and
+    ``short_links``, queue their rows with :meth:`submit_row` so they are written in the
+    same transactions. Their owners keep the rows in memory until then.
+
+    The queue holds at most ``max_queue`` entries and rows. Anything past that is dropped and
+    counted, as the entry was already served and will just be fetched again next time.
+    """
+
+    def __init__(self, *, max_queue: int, batch_size: int) -> None:
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self._stats = WriterStats()
+        self._pending: dict[str, CacheEntry] = {}
+        self._rows: dict[tuple[str, str], tuple[Any, ...]] = {}
+        self._wake = asyncio.Event()
+        self._closing = False
+        self._task: asyncio.Task[None] | None = None
+
+    def __len__(self) -> int:
+        return len(self._pending) + len(self._rows)
+
+    def submit(self, url: str, entry: CacheEntry) -> bool:
+        """Queues an entry to be written.
+
+        Args:
+            url (str): The cache key.
+            entry (CacheEntry): The entry. It is rendered now, if it isn't already.
+
+        Returns:
+            bool: Whether it was queued, this is ``False`` if the queue was full.
+        """
+        if url not in self._pending and len(self) >= self.max_queue:
+            self._stats.dropped += 1
+            return False
+
+        entry.render()
+        self._pending[url] = entry
+        self._wake.set()
+        return True
+
+    def submit_row(self, statement: str, key: str, params: tuple[Any, ...]) -> bool:
+        """Queues a row for one of the other tables to be written.
+
+        Args:
+            statement (str): The statement that writes the row, like an ``INSERT``.
+            key (str): What identifies the row. Queueing the same statement and key again before
+                it is written only keeps the newest params.
+            params (tuple[Any, ...]): The statement's parameters.
+
+        Returns:
+            bool: Whether it was queued, this is ``False`` if the queue was full.
+        """
+        if (statement, key) not in self._rows and len(self) >= self.max_queue:
+            self._stats.dropped += 1
+            return False
+
+        self._rows[statement, key] = params
+        self._wake.set()
+        return True
+
+    def get(self, url: str) -> CacheEntry | None:
+        """Gets the entry queued for the url, if it hasn't been written yet."""
+        return self._pending.get(url)
+
+    def stats(self) -> WriterStats:
+        self._stats.queued = len(self)
+        return self._stats
+
+    def start(self, db: Database) -> None:
+        """Starts writing queued entries to the database."""
+        self._closing = False
+        self._task = asyncio.create_task(self._run(db))
+
+    async def close(self) -> None:
+        """Writes everything still queued and stops the writer task."""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wake.set()
+        await self._task
+        self._task = None
+
+    async def _run(self, db: Database) -> None:
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self._pending or self._rows:
+                await self._write(
+                    db,
+                    list(itertools.islice(self._pending.items(), self.batch_size)),
+                    list(itertools.islice(self._rows.items(), self.batch_size)),
+                )
+            if self._closing:
+                return
+
+    async def _write(
+        self,
+        db: Database,
+        batch: list[tuple[str, CacheEntry]],
+        other_rows: list[tuple[tuple[str, str], tuple[Any, ...]]],
+    ) -> None:
+        rows = [
+            (url, entry.data, entry.expiry, entry.data_type, entry.render(), RENDER_VERSION) for url, entry in batch
+        ]
+        by_statement: dict[str, list[tuple[Any, ...]]] = {}
+        for (statement, _), params in other_rows:
+            by_statement.setdefault(statement, []).append(params)
+
+        count = len(batch) + len(other_rows)
+        start = time.perf_counter()
+        try:
+            async with db.write() as conn, conn.transaction():
+                if rows:
+                    await conn.executemany(UPSERT, rows)
+                for statement, params in by_statement.items():
+                    await conn.executemany(statement, params)
+        except Exception:
+            logger.exception("failed to write %d cache entries and rows.", count)
+            self._stats.failed += count
+        else:
+            self._stats.written += count
+            self._stats.batches += 1
+        self._stats.last_batch_seconds = time.perf_counter() - start
+
+        # Leave anything that was replaced by something newer while this batch was written queued.
+        for url, entry in batch:
+            if self._pending.get(url) is entry:
+                del self._pending[url]
+        for key, params in other_rows:
+            if self._rows.get(key) is params:
+                del self._rows[key]
+
+
+cache_writer = CacheWriter(
+    max_queue=CONFIG["cache"]["write_queue_size"],
+    batch_size=CONFIG["cache"]["write_batch_size"],
+)
@@ -2,10 +2,28 @@ CREATE TABLE IF NOT EXISTS cache (
     url TEXT PRIMARY KEY,
     data TEXT NOT NULL,
     expiry BIGINT NOT NULL,
-    type TEXT NOT NULL
+    type TEXT NOT NULL,
+    -- The rendered embed page, and the ``RENDER_VERSION`` it was rendered with.
+    html BLOB,
+    render_version TEXT
 );
 
-CREATE TRIGGER IF NOT EXISTS drop_old_cache AFTER INSERT ON cache
-BEGIN
-    DELETE FROM cache WHERE DATE('now') > DATE(expiry);
-END;
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS cache_expiry_idx ON cache (expiry);
+
+-- TikTok short links (like ``vm.tiktok.com/...``) and the video they redirect to. These never change, so they never expire.
+CREATE TABLE IF NOT EXISTS short_links (
+    url TEXT PRIMARY KEY,
+    aweme_id TEXT NOT NULL
+);
+
+-- Lookups that failed upstream, with the status they failed with, so they are answered
+-- locally until they expire. See ``embedit.failures``.
+CREATE TABLE IF NOT EXISTS failures (
+    url TEXT PRIMARY KEY,
+    status INTEGER NOT NULL,
+    detail TEXT,
+    expiry REAL NOT NULL
+);
+
+-- Expired rows are removed in batches by the sweeper task started in ``embedit.cache.lifespan``.
+DROP TRIGGER IF EXISTS drop_old_cache;
@@ -0,0 +1,4 @@
+import os
+
+# ``embedit`` reads its config on import, so point it at the template before any test imports it.
+os.environ.setdefault("EMBEDIT_CONFIG", "config-template.toml")
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from benchmarks.codec import legacy_encode
+from benchmarks.render import RECORDS
+from embedit import OpenGraphBaseData, decode_record, encode_record
+
+CASES = [
+    pytest.param(kind, data, id=f"{kind}-{index}")
+    for kind, records in RECORDS.items()
+    for index, data in enumerate(records)
+]
+
+
+@pytest.mark.parametrize(("kind", "data"), CASES)
+def test_round_trip(kind: str, data: OpenGraphBaseData) -> None:
+    decoded = decode_record(encode_record(data), kind)
+    assert type(decoded) is type(data)
+    assert decoded == data
+
+
+@pytest.mark.parametrize(("kind", "data"), CASES)
+def test_decodes_legacy_rows(kind: str, data: OpenGraphBaseData) -> None:
+    decoded = decode_record(legacy_encode(data), kind)
+    assert type(decoded) is type(data)
+    assert decoded == data
+
+
+def test_rejects_unknown_layout() -> None:
+    data = RECORDS["text"][0]
+    values = json.loads(encode_record(data))
+    values[0] = "x0000"
+    with pytest.raises(ValueError, match="layout"):
+        decode_record(json.dumps(values), "text")
@@ -0,0 +1,15 @@
+from __future__ import annotations
+
+import pytest
+
+from benchmarks.render import RECORDS, legacy_render
+from embedit import OpenGraphBaseData
+
+CASES = [
+    pytest.param(data, id=f"{kind}-{index}") for kind, records in RECORDS.items() for index, data in enumerate(records)
+]
+
+
+@pytest.mark.parametrize("data", CASES)
+def test_templates_match_legacy_renderer(data: OpenGraphBaseData) -> None:
+    assert data.to_html() == legacy_render(data)